@@ -1,6 +1,13 @@
+import cProfile
+import json
+import os
 import numpy as np
 import pygame
 import sys
+import time
+
+from search_guard import (DEFAULT_MAX_NODES, DEFAULT_MAX_SECONDS, SearchGuard, count_evaluations, evaluations_done,
+                          nodes_visited, visit_node)
 
 ROWS = 6
 COLS = 7
@@ -15,6 +22,37 @@ GREEN = (0, 255, 0)
 PLAYER_COLOR = None
 AI_COLOR = None
 
+# Heuristic weights; tune_weights.py writes tuned ones to weights.json
+WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights.json")
+DEFAULT_WEIGHTS = {
+    "four": 10,  # Win condition
+    "three": 6,  # Strong
+    "two": 3,  # Weak
+    "opp_one": -1,  # Opponent's single piece
+    "opp_three": -4,  # Block opponent's strong winning chance
+    "opp_two": -2,  # Block opponent's weak winning chance
+    "center": 3,  # Per piece in the center column
+}
+
+def load_weights(path=WEIGHTS_FILE):
+    weights = dict(DEFAULT_WEIGHTS)
+    if os.path.exists(path):
+        with open(path) as f:
+            weights.update({name: value for name, value in json.load(f).items() if name in DEFAULT_WEIGHTS})
+    return weights
+
+WEIGHTS = load_weights()
+
+# Exact endgame results, built offline by tablebase.py (python tablebase.py build)
+TABLEBASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endgame.c4tb")
+
+def load_tablebase(path=TABLEBASE_FILE):
+    from tablebase import load  # Shared with the other copy of this module when it runs as the script
+    return load(path)
+
+TABLEBASE = load_tablebase()
+TABLEBASE_ENGINES = frozenset({"alphabeta", "expectimax"})  # Engines whose leaves probe it (evaluate_leaf)
+
 # Create the game board
 def create_board():
     return np.zeros((ROWS, COLS), dtype=int)
@@ -42,17 +80,17 @@ def evaluate_window(window, piece):
     score = 0
     opponent_piece = 1 if piece == -1 else -1  # Opponent logic adjusted
     if window.count(piece) == 4:
-        score += 10  # Win condition
+        score += WEIGHTS["four"]  # Win condition
     elif window.count(piece) == 3 and window.count(0) == 1:
-        score += 6  # Strong 
+        score += WEIGHTS["three"]  # Strong 
     elif window.count(piece) == 2 and window.count(0) == 2:
-        score += 3  # Weak 
+        score += WEIGHTS["two"]  # Weak 
     if window.count(opponent_piece) == 1 and window.count(0) == 3:
-        score -= 1     
+        score += WEIGHTS["opp_one"]
     elif window.count(opponent_piece) == 3 and window.count(0) == 1:
-        score -= 4  # Block opponent's strong winning chance
+        score += WEIGHTS["opp_three"]  # Block opponent's strong winning chance
     if window.count(opponent_piece) == 2 and window.count(0) == 2:
-        score -= 2  # Block opponent's weak winning chance
+        score += WEIGHTS["opp_two"]  # Block opponent's weak winning chance
     return score
 def score_position(board, piece):
     score = 0
@@ -60,7 +98,7 @@ def score_position(board, piece):
     # Center column preference
     center_array = [int(board[row][COLS // 2]) for row in range(ROWS)]
     center_count = center_array.count(piece)
-    score += center_count * 3
+    score += center_count * WEIGHTS["center"]
 
     # Horizontal score
     for row in range(ROWS):
@@ -91,12 +129,31 @@ def score_position(board, piece):
 
 def evaluate_board(board):
 #   Heuristic evaluation of the board for the AI.
+    count_evaluations()
     ai_score = score_position(board, -1)  # AI's piece is -1
     player_score = score_position(board, 1)  # Player's piece is 1
     return ai_score - player_score  # AI tries to maximize this score
 
+# Exact results are scored outside the range of evaluate_board, which counts
+# every weight at most once per window and the center weight once per center
+# cell, for each side. A solved position then always outranks a guess.
+WINDOWS = ROWS * (COLS - 3) + COLS * (ROWS - 3) + 2 * (ROWS - 3) * (COLS - 3)
+EXACT_BASE = 2 * (WINDOWS * sum(abs(w) for name, w in WEIGHTS.items() if name != "center")
+                  + ROWS * abs(WEIGHTS["center"])) + 1
+
+# Value of a search leaf: when the tablebase has the position, its exact final
+# score difference pushed past EXACT_BASE in its own direction (a proven draw
+# stays 0), else evaluate_board
+def evaluate_leaf(state):
+    if TABLEBASE is not None:
+        result = TABLEBASE.probe(state)
+        if result is not None:
+            return (EXACT_BASE if result > 0 else -EXACT_BASE if result < 0 else 0) + result
+    return evaluate_board(state)
+
 # Maximizing function for Minimax
 def maximize(state, depth):
+    visit_node()  # Counted against the search budget (search_guard.py)
     if depth == 0 or is_full(state):  # Terminal condition
         evaluation = evaluate_board(state)
         return None, evaluation
@@ -117,6 +174,7 @@ def maximize(state, depth):
 
 # Minimizing function for Minimax 
 def minimize(state, depth):
+    visit_node()
     if depth == 0 or is_full(state):  # Terminal condition
         evaluation = evaluate_board(state)
         return None, evaluation
@@ -136,8 +194,9 @@ def minimize(state, depth):
     return min_child, min_utility
 
 def maximize_with_pruning(state, depth, alpha, beta):
+    visit_node()
     if depth == 0 or is_full(state):  # Terminal condition
-        evaluation = evaluate_board(state)
+        evaluation = evaluate_leaf(state)
         return None, evaluation
     
     max_child, max_utility = None, -float('inf')
@@ -162,8 +221,9 @@ def maximize_with_pruning(state, depth, alpha, beta):
 
 # Minimizing function for Minimax with Alpha-Beta Pruning
 def minimize_with_pruning(state, depth, alpha, beta):
+    visit_node()
     if depth == 0 or is_full(state):  # Terminal condition
-        evaluation = evaluate_board(state)
+        evaluation = evaluate_leaf(state)
         return None, evaluation
     
     min_child, min_utility = None, float('inf')
@@ -185,9 +245,98 @@ def minimize_with_pruning(state, depth, alpha, beta):
             break  # Prune the remaining branches
     
     return min_child, min_utility
-def expect_maximize(state, depth):
+
+# Principal Variation Search: the expected best move (from `pv_hint`, the line
+# found by the previous iteration) is searched with the full window, every other
+# move with a null window that only proves it is no better; a move that fails
+# high is re-searched. Returns the principal variation and its utility.
+def order_moves(valid_moves, pv_hint):
+    if pv_hint and pv_hint[0] in valid_moves:
+        return [pv_hint[0]] + [c for c in valid_moves if c != pv_hint[0]]
+    return valid_moves
+
+def maximize_pvs(state, depth, alpha, beta, pv_hint=()):
+    visit_node()
+    if depth == 0 or is_full(state):  # Terminal condition
+        evaluation = evaluate_board(state)
+        return [], evaluation
+
+    max_line, max_utility = [], -float('inf')
+    valid_moves = order_moves([c for c in range(COLS) if is_valid_move(state, c)], pv_hint)
+
+    for i, col in enumerate(valid_moves):
+        row = get_next_open_row(state, col)
+        child_state = state.copy()
+        drop_piece(child_state, row, col, -1)  # AI's move (AI = -1)
+
+        if i == 0:
+            line, utility = minimize_pvs(child_state, depth - 1, alpha, beta, pv_hint[1:])
+        else:
+            line, utility = minimize_pvs(child_state, depth - 1, alpha, alpha + 1)  # Null window
+            if alpha < utility < beta:
+                line, utility = minimize_pvs(child_state, depth - 1, utility, beta)  # Fail high: re-search
+
+        if utility > max_utility:
+            max_line, max_utility = [col] + line, utility
+
+        alpha = max(alpha, max_utility)
+        if beta <= alpha:
+            break  # Prune the remaining branches
+
+    return max_line, max_utility
+
+def minimize_pvs(state, depth, alpha, beta, pv_hint=()):
+    visit_node()
     if depth == 0 or is_full(state):  # Terminal condition
         evaluation = evaluate_board(state)
+        return [], evaluation
+
+    min_line, min_utility = [], float('inf')
+    valid_moves = order_moves([c for c in range(COLS) if is_valid_move(state, c)], pv_hint)
+
+    for i, col in enumerate(valid_moves):
+        row = get_next_open_row(state, col)
+        child_state = state.copy()
+        drop_piece(child_state, row, col, 1)  # Player's move (Player = 1)
+
+        if i == 0:
+            line, utility = maximize_pvs(child_state, depth - 1, alpha, beta, pv_hint[1:])
+        else:
+            line, utility = maximize_pvs(child_state, depth - 1, beta - 1, beta)  # Null window
+            if alpha < utility < beta:
+                line, utility = maximize_pvs(child_state, depth - 1, alpha, utility)  # Fail low: re-search
+
+        if utility < min_utility:
+            min_line, min_utility = [col] + line, utility
+
+        beta = min(beta, min_utility)
+        if beta <= alpha:
+            break  # Prune the remaining branches
+
+    return min_line, min_utility
+
+ASPIRATION_WINDOW = 10  # Half-width of the aspiration window around the previous score
+
+# Iterative deepening with aspiration windows: each depth is searched with a
+# narrow window around the previous depth's score and widened on failure.
+def pvs_search(board, depth):
+    line, score = maximize_pvs(board, 1, -float('inf'), float('inf'))
+    for d in range(2, depth + 1):
+        alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+        while True:
+            line_d, score_d = maximize_pvs(board, d, alpha, beta, line)
+            if score_d <= alpha:
+                alpha = -float('inf')  # Fail low: open the window downwards
+            elif score_d >= beta:
+                beta = float('inf')  # Fail high: open the window upwards
+            else:
+                break
+        line, score = line_d, score_d
+    return line, score
+def expect_maximize(state, depth):
+    visit_node()
+    if depth == 0 or is_full(state):  # Terminal condition
+        evaluation = evaluate_leaf(state)
         return None, evaluation
     
     max_child = None
@@ -224,8 +373,9 @@ def expect_maximize(state, depth):
 
 
 def expect_minimize(state, depth):
+    visit_node()
     if depth == 0 or is_full(state):  # Terminal condition
-        evaluation = evaluate_board(state)
+        evaluation = evaluate_leaf(state)
         return None, evaluation
     
     min_child = None
@@ -270,6 +420,31 @@ def ai_move_with_pruning(board, depth):
 def ai_move_expectimax(board, depth):
     col, _ = expect_maximize(board, depth)   # AI is the maximizer
     return col
+def ai_move_pvs(board, depth):
+    line, _ = pvs_search(board, depth)  # AI is the maximizer
+    return line[0]
+def ai_move_threat_search(board, depth):
+    import threats  # threats.py builds on this module
+    return threats.ai_move_threats(board, depth)
+def ai_move_value_net(board, depth):
+    import value_net  # Learned evaluation (python value_net.py train)
+    return value_net.ai_move_value_net(board, depth)
+
+VALUE_NET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "value_net.npz")
+
+# Engines by name, for callers that pick the search at runtime (e.g. game_server.py)
+AI_ENGINES = {
+    "minimax": ai_move,
+    "alphabeta": ai_move_with_pruning,
+    "expectimax": ai_move_expectimax,
+    "pvs": ai_move_pvs,
+    "threats": ai_move_threat_search,
+}
+if os.path.exists(VALUE_NET_FILE):
+    AI_ENGINES["valuenet"] = ai_move_value_net  # Only playable once a model has been trained
+
+def choose_ai_move(board, engine, depth):
+    return AI_ENGINES[engine](board, depth)
 # Draw the board
 def draw_board(board, screen):
     for r in range(ROWS):
@@ -285,7 +460,30 @@ def draw_board(board, screen):
                 pygame.draw.circle(screen, AI_COLOR, (c * SQUARESIZE + SQUARESIZE // 2, (r + 1) * SQUARESIZE + SQUARESIZE // 2), RADIUS)
     pygame.display.update()
 
-def calculate_final_scores(board):
+# Show the expected line of play in the strip above the board
+def draw_line(line, screen):
+    pygame.draw.rect(screen, BLACK, (0, 0, COLS * SQUARESIZE, SQUARESIZE))
+    if len(line) > 1:
+        font = pygame.font.Font(None, 36)
+        text = font.render("Expected line: " + " ".join(str(col + 1) for col in line[1:]), True, (255, 255, 255))
+        screen.blit(text, (10, SQUARESIZE // 2 - 12))
+    pygame.display.update()
+
+# Performance of the last AI move, in a band at the top of the strip above the
+# board (drawn after draw_line, which clears the whole strip)
+def draw_hud(stats, screen):
+    pygame.draw.rect(screen, BLACK, (0, 0, COLS * SQUARESIZE, 30))
+    if stats["pondered"]:
+        text = f"AI: {stats['seconds']:.2f}s, answered from pondering"
+    else:
+        rate = stats["nodes"] / stats["seconds"] if stats["seconds"] > 0 else 0
+        text = (f"AI: {stats['seconds']:.2f}s  {rate:,.0f} nodes/s  depth {stats['depth']}/{stats['requested']}  "
+                f"{stats['evaluations']:,} evals")
+    font = pygame.font.Font(None, 24)
+    screen.blit(font.render(text, True, (200, 200, 200)), (10, 8))
+    pygame.display.update()
+
+def calculate_final_scores(board, verbose=True):
     player_score = 0
     ai_score = 0
 
@@ -300,11 +498,13 @@ def calculate_final_scores(board):
             if set(positions).isdisjoint(counted_positions):  # Only count if not already counted
                 if window == [1, 1, 1, 1]:  # Player's piece
                     player_score += 1
-                    print(f"Player 4-in-row horizontally at: {positions}")
+                    if verbose:
+                        print(f"Player 4-in-row horizontally at: {positions}")
                     counted_positions.update(positions)  # Add positions to counted
                 elif window == [-1, -1, -1, -1]:  # AI's piece
                     ai_score += 1
-                    print(f"AI 4-in-row horizontally at: {positions}")
+                    if verbose:
+                        print(f"AI 4-in-row horizontally at: {positions}")
                     counted_positions.update(positions)  # Add positions to counted
 
     # Vertical check
@@ -315,11 +515,13 @@ def calculate_final_scores(board):
             if set(positions).isdisjoint(counted_positions):  # Only count if not already counted
                 if window == [1, 1, 1, 1]:  # Player's piece
                     player_score += 1
-                    print(f"Player 4-in-row vertically at: {positions}")
+                    if verbose:
+                        print(f"Player 4-in-row vertically at: {positions}")
                     counted_positions.update(positions)  # Add positions to counted
                 elif window == [-1, -1, -1, -1]:  # AI's piece
                     ai_score += 1
-                    print(f"AI 4-in-row vertically at: {positions}")
+                    if verbose:
+                        print(f"AI 4-in-row vertically at: {positions}")
                     counted_positions.update(positions)  # Add positions to counted
 
     # Positive diagonal check (/)
@@ -330,7 +532,8 @@ def calculate_final_scores(board):
             if set(positions).isdisjoint(counted_positions):  # Only count if not already counted
                 if window == [1, 1, 1, 1]:  # Player's piece
                     player_score += 1
-                    print(f"Player 4-in-row diagonally (\\) at: {positions}")
+                    if verbose:
+                        print(f"Player 4-in-row diagonally (\\) at: {positions}")
     # negative diagonal check (\)
     for row in range(3, ROWS):
         for col in range(COLS - 3):
@@ -339,10 +542,13 @@ def calculate_final_scores(board):
             if set(positions).isdisjoint(counted_positions):  # Only count if not already counted
                 if window == [1, 1, 1, 1]:  # Player's piece
                     player_score += 1
-                    print(f"Player 4-in-row diagonally (/) at: {positions}")                
-    print(f"Final Scores")
-    print(f"Player Score: {player_score}")
-    print(f"AI Score: {ai_score}")        
+                    if verbose:
+                        print(f"Player 4-in-row diagonally (/) at: {positions}")                
+    if verbose:
+        print(f"Final Scores")
+        print(f"Player Score: {player_score}")
+        print(f"AI Score: {ai_score}")
+    return player_score, ai_score
 
 
 # Main game loop
@@ -361,6 +567,8 @@ def setup_screen():
     input_active = False
     use_alpha_beta = False  # Default to no Alpha-Beta pruning
     use_expectimax = False  # Default to not using Expectimax
+    use_pvs = False  # Default to not using Principal Variation Search
+    use_threats = False  # Default to not using threat analysis
     running = True
 
     while running:
@@ -407,11 +615,21 @@ def setup_screen():
         expectimax_text = small_font.render("Use Expectiminimax Algorithm", True, (255, 255, 255))
         screen.blit(expectimax_text, (70, 405))
 
+        # Principal Variation Search and threat analysis options
+        pvs_button = pygame.Rect(50, 450, 200, 50)
+        threats_button = pygame.Rect(250, 450, 200, 50)
+        pygame.draw.rect(screen, (0, 128, 128), pvs_button)
+        pygame.draw.rect(screen, (128, 64, 0), threats_button)
+        pvs_text = small_font.render("With PVS", True, (255, 255, 255))
+        threats_text = small_font.render("With Threats", True, (255, 255, 255))
+        screen.blit(pvs_text, (105, 465))
+        screen.blit(threats_text, (290, 465))
+
         # Start button
-        start_button = pygame.Rect(200, 450, 100, 50)
+        start_button = pygame.Rect(200, 520, 100, 50)
         pygame.draw.rect(screen, (0, 0, 255), start_button)
         start_text = small_font.render("Start", True, (255, 255, 255))
-        screen.blit(start_text, (230, 465))
+        screen.blit(start_text, (230, 535))
         
         pygame.display.flip()
 
@@ -441,19 +659,39 @@ def setup_screen():
                 if alpha_beta_button.collidepoint(mouse_pos):
                     use_alpha_beta = True
                     use_expectimax = False  # Disable Expectimax
+                    use_pvs = False  # Disable PVS
+                    use_threats = False  # Disable threat analysis
                 elif no_alpha_beta_button.collidepoint(mouse_pos):
                     use_alpha_beta = False
                     use_expectimax = False  # Disable Expectimax
+                    use_pvs = False  # Disable PVS
+                    use_threats = False  # Disable threat analysis
                 
                 # Toggle Expectimax
                 if expectimax_button.collidepoint(mouse_pos):
                     use_expectimax = True
                     use_alpha_beta = False  # Disable Alpha-Beta
+                    use_pvs = False  # Disable PVS
+                    use_threats = False  # Disable threat analysis
+
+                # Toggle PVS
+                if pvs_button.collidepoint(mouse_pos):
+                    use_pvs = True
+                    use_alpha_beta = False  # Disable Alpha-Beta
+                    use_expectimax = False  # Disable Expectimax
+                    use_threats = False  # Disable threat analysis
+
+                # Toggle threat analysis
+                if threats_button.collidepoint(mouse_pos):
+                    use_threats = True
+                    use_alpha_beta = False  # Disable Alpha-Beta
+                    use_expectimax = False  # Disable Expectimax
+                    use_pvs = False  # Disable PVS
 
                 # Start the game if all selections are valid
                 if start_button.collidepoint(mouse_pos):
                     if player_color and depth.isdigit() and int(depth) > 0:
-                        return player_color, ai_color, int(depth), use_alpha_beta, use_expectimax
+                        return player_color, ai_color, int(depth), use_alpha_beta, use_expectimax, use_pvs, use_threats
 
             elif event.type == pygame.KEYDOWN and input_active:
                 # Handle text input for depth
@@ -465,19 +703,59 @@ def setup_screen():
         clock.tick(30)
 
     pygame.quit()
-    return player_color, ai_color, depth, use_alpha_beta, use_expectimax
-
-def play_game():
+    return player_color, ai_color, depth, use_alpha_beta, use_expectimax, use_pvs, use_threats
+
+# Search the AI move with the engine picked in the setup screen. Returns the
+# column and, for PVS, the expected line that follows it.
+def search_ai_move(board, depth, engine):
+    if engine == "pvs":
+        line, _ = pvs_search(board, depth)  # Principal Variation Search
+        return line[0], line
+    return choose_ai_move(board, engine, depth), None
+
+_search_guard = None  # One per process, so branching measurements carry over between moves
+
+# search_ai_move within a node and time budget, lowering the depth when it
+# would not fit (used by the pondering workers)
+def guarded_search_ai_move(board, depth, engine, max_nodes=DEFAULT_MAX_NODES, max_seconds=DEFAULT_MAX_SECONDS):
+    global _search_guard
+    if _search_guard is None:
+        _search_guard = SearchGuard()
+    _search_guard.max_nodes, _search_guard.max_seconds = max_nodes, max_seconds
+    return _search_guard.search(search_ai_move, board, engine, depth, engine)
+
+def play_game(record_path=None, ponder=False, ponder_cpu_budget=None, tree_memory_mb=None,
+              max_nodes=DEFAULT_MAX_NODES, max_seconds=DEFAULT_MAX_SECONDS, profile_dir=None):
     global PLAYER_COLOR, AI_COLOR
     # Setup screen for color, depth, Alpha-Beta pruning, and Expectimax selection
-    PLAYER_COLOR, AI_COLOR, depth, use_alpha_beta, use_expectimax = setup_screen()
+    PLAYER_COLOR, AI_COLOR, depth, use_alpha_beta, use_expectimax, use_pvs, use_threats = setup_screen()
     print(f"Selected Player Color: {PLAYER_COLOR}")
     print(f"Selected AI Depth: {depth}")
     print(f"Alpha-Beta Pruning: {'Enabled' if use_alpha_beta else 'Disabled'}")
     print(f"Expectiminimax: {'Enabled' if use_expectimax else 'Disabled'}")
+    print(f"Principal Variation Search: {'Enabled' if use_pvs else 'Disabled'}")
+    print(f"Threat Analysis: {'Enabled' if use_threats else 'Disabled'}")
+    engine = "expectimax" if use_expectimax else "pvs" if use_pvs else "threats" if use_threats else "alphabeta" if use_alpha_beta else "minimax"
+
+    ponderer = None
+    if ponder:
+        from ponder import Ponderer, PONDER_CPU_BUDGET
+        ponderer = Ponderer(guarded_search_ai_move, depth, engine, max_nodes, max_seconds,
+                            cpu_budget=PONDER_CPU_BUDGET if ponder_cpu_budget is None else ponder_cpu_budget)
+
+    tree = None
+    if engine in ("alphabeta", "expectimax"):
+        from search_tree import ReusableSearch, SEARCH_TREE_MEMORY_MB
+        tree = ReusableSearch(engine, SEARCH_TREE_MEMORY_MB if tree_memory_mb is None else tree_memory_mb)
+
+    guard = SearchGuard(max_nodes, max_seconds)  # Any depth can be typed in the setup screen
 
     board = create_board()
     turn = 1  # Start with the player
+    moves = []  # Columns played, for the game record
+    think_times = []  # Seconds spent on each AI move
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
 
     pygame.init()
     screen = pygame.display.set_mode((COLS * SQUARESIZE, (ROWS + 1) * SQUARESIZE))
@@ -485,6 +763,8 @@ def play_game():
     draw_board(board, screen)
 
     while not is_full(board):
+        if tree and turn == 1:
+            tree.release()  # Free the search tree dropped last move while the player thinks
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -498,24 +778,83 @@ def play_game():
                     if is_valid_move(board, col):
                         row = get_next_open_row(board, col)
                         drop_piece(board, row, col, 1)  # Player move
+                        moves.append(col)
                         draw_board(board, screen)
                         turn = -1  # Switch to AI turn
         # AI turn
         if turn == -1:
-            if use_expectimax:
-                col, _ = expect_maximize(board, depth)  # Expectimax
-            elif use_alpha_beta:
-                col = ai_move_with_pruning(board, depth)  # With Alpha-Beta pruning
-            else:
-                col = ai_move(board, depth)  # Without Alpha-Beta pruning
+            profiler = cProfile.Profile() if profile_dir else None
+            if profiler:
+                profiler.enable()
+            start, start_nodes, start_evaluations = time.perf_counter(), nodes_visited(), evaluations_done()
+            result = ponderer.take(board) if ponderer else None  # Already searched on the player's time
+            pondered = result is not None
+            if result is None and tree:
+                # Reuses last move's search below this position
+                result = guard.search(lambda state, d: (tree.ai_move(state, d), None), board, engine, depth)
+                report = tree.last_report
+                print(f"AI move: {report['nodes']} nodes searched, {report['reused']} stored results reused "
+                      f"(~{report['saved']} nodes saved), {report['guided']} nodes ordered by stored moves, "
+                      f"{report['stored']} nodes kept (~{report['memory_kb']} KB)")
+            if result is None:
+                result = guard.search(search_ai_move, board, engine, depth, engine)
+            if guard.last_report and guard.last_report["reached"] < depth:
+                report = guard.last_report
+                print(f"AI move: searched to depth {report['reached']} of {depth} "
+                      f"({report['nodes']} nodes in {report['seconds']:.1f}s"
+                      f"{', stopped at the node/time cap' if report['aborted'] else ''})")
+            col, line = result
+            think_times.append(time.perf_counter() - start)
+            hud = {
+                "seconds": think_times[-1],
+                "nodes": nodes_visited() - start_nodes,
+                "evaluations": evaluations_done() - start_evaluations,
+                "depth": guard.last_report["reached"] if guard.last_report else depth,
+                "requested": depth,
+                "pondered": pondered,
+            }
+            guard.last_report = None
+            if profiler:
+                profiler.disable()
+                profile_path = os.path.join(profile_dir, f"move_{len(think_times):02d}.prof")
+                profiler.dump_stats(profile_path)  # Inspect with: python -m pstats <file>
+                print(f"AI move profile written to {profile_path}")
             
             row = get_next_open_row(board, col)
             drop_piece(board, row, col, -1)  # AI move
+            moves.append(col)
             draw_board(board, screen)
+            if line:
+                draw_line(line, screen)  # Expected continuation, starting with the player's reply
+            draw_hud(hud, screen)
+            if ponderer and not is_full(board):
+                ponderer.start(board)  # Search the player's likely replies while they think
             turn = 1  # Switch to player turn
     print(board)
     calculate_final_scores(board)
+    if ponderer:
+        print(f"Pondering: {ponderer.hits} replies answered from pondering, {ponderer.misses} searched from scratch")
+        ponderer.shutdown()
+    if TABLEBASE is not None:
+        print(f"Tablebase: {TABLEBASE.hits} endgame positions found, {TABLEBASE.misses} not in the tablebase")
+
+    if record_path:
+        from game_record import GameRecordWriter
+        with GameRecordWriter(record_path) as writer:
+            writer.write(moves, engine, depth, 1, sum(think_times) * 1000, max(think_times, default=0) * 1000)
+        print(f"Game recorded to {record_path}")
 
 if __name__ == "__main__":
-    play_game()
+    import argparse
+    parser = argparse.ArgumentParser(description="Play Connect Four against the AI")
+    parser.add_argument("record", nargs="?", default=None, help="append the finished game to this game record file")
+    parser.add_argument("--ponder", action="store_true", help="search the player's likely replies while they think")
+    parser.add_argument("--ponder-cpu", type=float, default=None, help="fraction of CPU cores used for pondering")
+    parser.add_argument("--tree-memory", type=float, default=None, help="MB of search results kept between moves")
+    parser.add_argument("--max-nodes", type=int, default=DEFAULT_MAX_NODES, help="node budget per AI move")
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS, help="time budget per AI move")
+    parser.add_argument("--profile", default=None, metavar="DIR", help="profile every AI move into DIR/move_NN.prof")
+    args = parser.parse_args()
+    play_game(args.record, args.ponder, args.ponder_cpu, args.tree_memory, args.max_nodes, args.max_seconds,
+              args.profile)
     print("Game Over!")
\ No newline at end of file
@@ -0,0 +1,83 @@
+# Vectorized board features.
+#
+# evaluate_board scores the 69 windows of four cells one at a time. Here the
+# same windows are gathered for a whole batch of boards with one NumPy indexing
+# operation, so that thousands of positions can be scored at once.
+import numpy as np
+
+from ConnectFour import ROWS, COLS, DEFAULT_WEIGHTS, WEIGHTS
+from search_guard import count_evaluations
+
+
+# Flat cell indices of every window of four, in score_position's order
+def _windows():
+    windows = []
+    for row in range(ROWS):  # Horizontal
+        for col in range(COLS - 3):
+            windows.append([row * COLS + col + i for i in range(4)])
+    for col in range(COLS):  # Vertical
+        for row in range(ROWS - 3):
+            windows.append([(row + i) * COLS + col for i in range(4)])
+    for row in range(ROWS - 3):  # Positive diagonal
+        for col in range(COLS - 3):
+            windows.append([(row + i) * COLS + col + i for i in range(4)])
+    for row in range(3, ROWS):  # Negative diagonal
+        for col in range(COLS - 3):
+            windows.append([(row - i) * COLS + col + i for i in range(4)])
+    return np.array(windows)
+
+
+WINDOWS = _windows()
+WEIGHT_NAMES = list(DEFAULT_WEIGHTS)
+
+
+# Cell contents of every window: shape (boards, 69, 4)
+def window_cells(boards):
+    boards = np.asarray(boards)
+    return boards.reshape(len(boards), ROWS * COLS)[:, WINDOWS]
+
+
+# Per board, how many of evaluate_window's patterns `piece` has, plus its
+# center column count, in WEIGHT_NAMES order: shape (boards, 7)
+def pattern_counts(cells, boards, piece):
+    own = np.sum(cells == piece, axis=2)
+    opponent = np.sum(cells == -piece, axis=2)
+    empty = np.sum(cells == 0, axis=2)
+    return np.stack([
+        np.sum(own == 4, axis=1),
+        np.sum((own == 3) & (empty == 1), axis=1),
+        np.sum((own == 2) & (empty == 2), axis=1),
+        np.sum((opponent == 1) & (empty == 3), axis=1),
+        np.sum((opponent == 3) & (empty == 1), axis=1),
+        np.sum((opponent == 2) & (empty == 2), axis=1),
+        np.sum(boards[:, :, COLS // 2] == piece, axis=1),
+    ], axis=1)
+
+
+# Features whose dot product with a weight vector is evaluate_board under
+# those weights: AI pattern counts minus player pattern counts
+def heuristic_features(boards):
+    boards = np.asarray(boards)
+    cells = window_cells(boards)
+    return pattern_counts(cells, boards, -1) - pattern_counts(cells, boards, 1)
+
+
+def weight_vector(weights=None):
+    weights = WEIGHTS if weights is None else weights
+    return np.array([weights[name] for name in WEIGHT_NAMES], dtype=float)
+
+
+# evaluate_board for a batch of boards
+def evaluate_boards(boards, weights=None):
+    count_evaluations(len(boards))
+    return heuristic_features(boards) @ weight_vector(weights)
+
+
+# One feature per window for learned evaluations: the AI's lead in pieces in
+# that window (AI pieces minus player pieces, over 4), or 0 once both sides have
+# a piece in it and neither can complete it. Shape (boards, 69).
+def window_features(boards):
+    cells = window_cells(boards)
+    ai = np.sum(cells == -1, axis=2)
+    player = np.sum(cells == 1, axis=2)
+    return np.where((ai == 0) | (player == 0), (ai - player) / 4.0, 0.0)
@@ -0,0 +1,185 @@
+# Compact binary game records.
+#
+# A record file starts with an 8 byte file header (magic + format version)
+# followed by games back to back. Each game is a 12 byte header
+#
+#   engine code (uint8), depth (uint8), first piece (int8), move count (uint8),
+#   total AI think time in ms (uint32), longest AI move in ms (uint32)
+#
+# and then the moves, one column per nibble (low nibble first, padded with 0xF).
+# Files are only ever appended to; readers memory-map them and stream games one
+# at a time, so millions of games never have to be in memory at once.
+import mmap
+import os
+import struct
+import sys
+from collections import namedtuple
+
+from ConnectFour import ROWS, COLS, create_board, drop_piece, get_next_open_row, calculate_final_scores
+
+FILE_MAGIC = b"C4GR"
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<4sB3x")
+GAME_HEADER = struct.Struct("<BBbBII")
+PAD_NIBBLE = 0xF
+MAX_MOVES = ROWS * COLS
+MAX_DEPTH = 255  # Depth is stored in one byte; deeper searches are recorded as 255
+
+# Engine codes are stored on disk: only ever append to this list
+ENGINE_CODES = ["minimax", "alphabeta", "expectimax", "pvs", "threats", "valuenet"]
+UNKNOWN_ENGINE = 0xFF
+
+GameRecord = namedtuple("GameRecord", ["engine", "depth", "first_piece", "moves", "think_ms", "max_move_ms"])
+
+
+class RecordFormatError(Exception):
+    pass
+
+
+def engine_code(engine):
+    if engine in ENGINE_CODES:
+        return ENGINE_CODES.index(engine)
+    return UNKNOWN_ENGINE
+
+
+def engine_name(code):
+    if code < len(ENGINE_CODES):
+        return ENGINE_CODES[code]
+    return None
+
+
+def pack_moves(moves):
+    packed = bytearray((len(moves) + 1) // 2)
+    for i, col in enumerate(moves):
+        if not 0 <= col < COLS:
+            raise ValueError(f"invalid column {col}")
+        packed[i // 2] |= col << (4 * (i % 2))
+    if len(moves) % 2:
+        packed[-1] |= PAD_NIBBLE << 4
+    return bytes(packed)
+
+
+def unpack_moves(data, count):
+    return tuple((data[i // 2] >> (4 * (i % 2))) & 0xF for i in range(count))
+
+
+class GameRecordWriter:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION))
+        else:
+            check_file_header(path)
+
+    def write(self, moves, engine=None, depth=0, first_piece=1, think_ms=0, max_move_ms=0):
+        if len(moves) > MAX_MOVES:
+            raise ValueError(f"a game has at most {MAX_MOVES} moves")
+        if depth < 0:
+            raise ValueError(f"depth must not be negative, got {depth}")
+        header = GAME_HEADER.pack(engine_code(engine), min(depth, MAX_DEPTH), first_piece, len(moves),
+                                  int(think_ms), int(max_move_ms))
+        self.file.write(header + pack_moves(moves))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check_file_header(path):
+    with open(path, "rb") as f:
+        header = f.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise RecordFormatError(f"{path}: truncated file header")
+    magic, version = FILE_HEADER.unpack(header)
+    if magic != FILE_MAGIC:
+        raise RecordFormatError(f"{path}: not a game record file")
+    if version != FORMAT_VERSION:
+        raise RecordFormatError(f"{path}: unsupported format version {version}")
+
+
+# Stream every game in a record file
+def read_games(path):
+    check_file_header(path)
+    if os.path.getsize(path) == FILE_HEADER.size:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offset = FILE_HEADER.size
+        end = len(data)
+        while offset < end:
+            if offset + GAME_HEADER.size > end:
+                raise RecordFormatError(f"{path}: truncated game header at byte {offset}")
+            code, depth, first_piece, count, think_ms, max_move_ms = GAME_HEADER.unpack_from(data, offset)
+            offset += GAME_HEADER.size
+            size = (count + 1) // 2
+            if offset + size > end:
+                raise RecordFormatError(f"{path}: truncated moves at byte {offset}")
+            moves = unpack_moves(data[offset:offset + size], count)
+            offset += size
+            yield GameRecord(engine_name(code), depth, first_piece, moves, think_ms, max_move_ms)
+
+
+# Rebuild a game move by move. The same board is updated in place and yielded
+# after every move as (board, row, col, piece); copy it to keep a position.
+def replay(record):
+    board = create_board()
+    piece = record.first_piece
+    for col in record.moves:
+        row = get_next_open_row(board, col)
+        if row is None:
+            raise RecordFormatError(f"move into full column {col}")
+        drop_piece(board, row, col, piece)
+        yield board, row, col, piece
+        piece = -piece
+
+
+# Positions for training: every position of every game in `path`, labelled
+# with the final score difference of that game (AI minus player)
+def training_positions(path):
+    for record in read_games(path):
+        positions = []
+        board = None
+        for board, _, _, _ in replay(record):
+            positions.append(board.copy())
+        if board is None:
+            continue
+        player_score, ai_score = calculate_final_scores(board, verbose=False)
+        for position in positions:
+            yield position, ai_score - player_score
+
+
+# Per-engine results over every game in `path`
+def summarize(path):
+    results = {}
+    for record in read_games(path):
+        board = create_board()
+        for board, _, _, _ in replay(record):
+            pass
+        player_score, ai_score = calculate_final_scores(board, verbose=False)
+        stats = results.setdefault((record.engine, record.depth), {"games": 0, "ai_wins": 0, "player_wins": 0,
+                                                                   "draws": 0, "think_ms": 0})
+        stats["games"] += 1
+        stats["think_ms"] += record.think_ms
+        if ai_score > player_score:
+            stats["ai_wins"] += 1
+        elif player_score > ai_score:
+            stats["player_wins"] += 1
+        else:
+            stats["draws"] += 1
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python game_record.py <record file>")
+        sys.exit(1)
+    for (engine, depth), stats in sorted(summarize(sys.argv[1]).items(), key=lambda item: str(item[0])):
+        print(f"{engine or 'unknown'} depth {depth}: {stats['games']} games, "
+              f"AI {stats['ai_wins']} / player {stats['player_wins']} / draws {stats['draws']}, "
+              f"{stats['think_ms'] / stats['games']:.0f}ms AI time per game")
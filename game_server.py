@@ -0,0 +1,304 @@
+# Headless Connect Four server.
+#
+# Speaks line-delimited JSON over TCP on localhost. One connection can host any
+# number of games; every AI move is sent to a bounded process pool running the
+# engines from ConnectFour.py. Identical searches from different games are
+# merged and cached by search_cache.py.
+#
+# Requests (an optional "id" field is echoed back in the reply):
+#   {"op": "new", "engine": "alphabeta", "depth": 4}
+#   {"op": "move", "game": 1, "col": 3}
+#   {"op": "close", "game": 1}
+#   {"op": "stats"}
+#
+# Replies always carry "ok"; failures carry "error" instead of a result.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # Workers import ConnectFour (and pygame)
+
+from game_record import GameRecordWriter
+from search_cache import SYMMETRIC_ENGINES, SearchCache
+from ConnectFour import (AI_ENGINES, TABLEBASE, TABLEBASE_ENGINES, choose_ai_move, create_board, drop_piece,
+                         get_next_open_row, is_full, is_valid_move)
+from search_guard import SearchGuard
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_DEPTH = 8
+MAX_LINE = 64 * 1024
+DEADLINE_MARGIN = 0.8  # Share of the deadline a worker may search before returning its best move so far
+
+
+class ServerBusy(Exception):
+    pass
+
+
+_guard = None  # One per worker process, so branching measurements carry over between moves
+
+# Runs in a worker: the engine's move within the node budget and `seconds`,
+# with the depth the search actually completed
+def guarded_move(board, engine, depth, seconds):
+    global _guard
+    if _guard is None:
+        _guard = SearchGuard()
+    _guard.max_seconds = seconds
+    col = _guard.search(lambda state, d: choose_ai_move(state, engine, d), board, engine, depth)
+    return col, _guard.last_report["reached"]
+
+
+class Game:
+    def __init__(self, game_id, engine, depth):
+        self.id = game_id
+        self.engine = engine
+        self.depth = depth
+        self.board = create_board()
+        self.moves = []
+        self.think_times = []
+        self.busy = False  # A move for this game is already being searched
+
+    def state(self):
+        return {"game": self.id, "board": self.board.tolist(), "over": bool(is_full(self.board))}
+
+
+class EnginePool:
+    # Runs AI searches in worker processes.
+    #
+    # At most `workers` searches run at once; up to `max_queued` more wait their
+    # turn here (not inside the executor, so a cancelled request never reaches a
+    # worker). Anything beyond that is rejected with ServerBusy.
+    def __init__(self, workers=None, max_queued=1000, deadline=10.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.deadline = deadline
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.slots = asyncio.Semaphore(self.workers)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+    async def search(self, board, engine, depth, deadline=None):
+        if self.waiting >= self.max_queued:
+            raise ServerBusy()
+        deadline = self.deadline if deadline is None else deadline
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + deadline
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), deadline)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        seconds = max(0.0, give_up_at - loop.time()) * DEADLINE_MARGIN
+        job = loop.run_in_executor(self.executor, guarded_move, board, engine, depth, seconds)
+        # The worker stops searching in time for the deadline and answers with
+        # the deepest completed depth. A search still running at the deadline
+        # (e.g. stuck at depth 1) is not interrupted; its result is dropped and
+        # the slot stays taken until the worker is actually free again.
+        job.add_done_callback(self._job_finished)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(job), max(0.0, give_up_at - loop.time()))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.completed += 1
+        return result
+
+    def _job_finished(self, job):
+        self.running -= 1
+        self.slots.release()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class GameServer:
+    def __init__(self, pool, cache, recorder=None, max_games_per_client=10000):
+        self.pool = pool
+        self.cache = cache
+        self.recorder = recorder  # GameRecordWriter for finished games, if any
+        self.max_games_per_client = max_games_per_client
+        self.game_ids = itertools.count(1)
+        self.clients = 0
+        self.games = 0
+
+    async def handle_client(self, reader, writer):
+        games = {}
+        tasks = set()
+        write_lock = asyncio.Lock()
+        self.clients += 1
+
+        async def reply(message):
+            async with write_lock:
+                writer.write((json.dumps(message) + "\n").encode())
+                await writer.drain()  # Backpressure from slow readers
+
+        async def run(request):
+            try:
+                response = await self.dispatch(request, games)
+            except ServerBusy:
+                response = {"ok": False, "error": "busy"}
+            except asyncio.TimeoutError:
+                response = {"ok": False, "error": "deadline exceeded"}
+            except (KeyError, TypeError, ValueError) as e:
+                response = {"ok": False, "error": f"bad request: {e}"}
+            except Exception as e:  # E.g. a failed search in a worker; the client must still get a reply
+                response = {"ok": False, "error": f"internal error: {type(e).__name__}: {e}"}
+            if "id" in request:
+                response["id"] = request["id"]
+            await reply(response)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be an object")
+                except ValueError as e:
+                    await reply({"ok": False, "error": f"bad request: {e}"})
+                    continue
+                task = asyncio.create_task(run(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            # Client went away: abandon its searches and drop its games
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.games -= len(games)
+            self.clients -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, request, games):
+        op = request["op"]
+        if op == "new":
+            engine = request.get("engine", "alphabeta")
+            depth = int(request.get("depth", 4))
+            if engine not in AI_ENGINES:
+                raise ValueError(f"unknown engine {engine!r}")
+            if not 0 < depth <= MAX_DEPTH:
+                raise ValueError(f"depth must be between 1 and {MAX_DEPTH}")
+            if len(games) >= self.max_games_per_client:
+                raise ServerBusy()
+            game = Game(next(self.game_ids), engine, depth)
+            games[game.id] = game
+            self.games += 1
+            return {"ok": True, **game.state()}
+        if op == "move":
+            return await self.play_move(games[request["game"]], int(request["col"]), request.get("deadline"))
+        if op == "close":
+            del games[request["game"]]
+            self.games -= 1
+            return {"ok": True}
+        if op == "stats":
+            return {"ok": True, "clients": self.clients, "games": self.games, "pool": self.pool.stats(), "cache": self.cache.stats()}
+        raise ValueError(f"unknown op {op!r}")
+
+    async def play_move(self, game, col, deadline=None):
+        if game.busy:
+            raise ValueError("previous move still in progress")
+        if is_full(game.board):
+            raise ValueError("game is over")
+        if not (0 <= col < game.board.shape[1] and is_valid_move(game.board, col)):
+            raise ValueError(f"invalid column {col}")
+
+        row = get_next_open_row(game.board, col)
+        drop_piece(game.board, row, col, 1)  # Player move
+        ai_col = None
+        if not is_full(game.board):
+            game.busy = True
+            start = time.perf_counter()
+            try:
+                ai_col = await self.cache.get(game.board.copy(), game.engine, game.depth, self.pool.search,
+                                              None if deadline is None else float(deadline))
+            except BaseException:
+                # Take the player's move back so the client can retry it
+                game.board[row][col] = 0
+                raise
+            finally:
+                game.busy = False
+            game.think_times.append(time.perf_counter() - start)
+            drop_piece(game.board, get_next_open_row(game.board, ai_col), ai_col, -1)  # AI move
+        game.moves.append(col)
+        if ai_col is not None:
+            game.moves.append(ai_col)
+        if self.recorder is not None and is_full(game.board):
+            self.recorder.write(game.moves, game.engine, game.depth, 1, sum(game.think_times) * 1000,
+                                max(game.think_times, default=0) * 1000)
+        return {"ok": True, "player_col": col, "ai_col": ai_col, **game.state()}
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, max_queued=1000, deadline=10.0,
+                cache_size=100000, cache_ttl=3600.0, record_path=None):
+    pool = EnginePool(workers, max_queued, deadline)
+    recorder = GameRecordWriter(record_path) if record_path else None
+    symmetric_engines = SYMMETRIC_ENGINES
+    if TABLEBASE is not None:
+        # Exact endgame scores differ between mirror images (see tablebase.py)
+        symmetric_engines = SYMMETRIC_ENGINES - TABLEBASE_ENGINES
+    server = GameServer(pool, SearchCache(cache_size, cache_ttl, deadline=deadline,
+                                          symmetric_engines=symmetric_engines), recorder)
+    listener = await asyncio.start_server(server.handle_client, host, port, limit=MAX_LINE)
+    print(f"Serving Connect Four on {host}:{port} with {pool.workers} engine workers")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        pool.shutdown()
+        if recorder is not None:
+            recorder.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless Connect Four game server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="engine processes (default: CPU count)")
+    parser.add_argument("--max-queued", type=int, default=1000, help="searches allowed to wait for a worker")
+    parser.add_argument("--deadline", type=float, default=10.0, help="seconds allowed per AI move")
+    parser.add_argument("--cache-size", type=int, default=100000, help="finished searches kept for reuse")
+    parser.add_argument("--cache-ttl", type=float, default=3600.0, help="seconds a finished search stays reusable")
+    parser.add_argument("--record", default=None, help="append finished games to this game record file")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_queued, args.deadline,
+                          args.cache_size, args.cache_ttl, args.record))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,125 @@
+# Load generator for game_server.py.
+#
+# Opens a number of connections, plays several games concurrently on each one
+# with random legal moves, and reports throughput and AI move latency.
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from game_server import DEFAULT_HOST, DEFAULT_PORT
+
+
+class Connection:
+    # One client connection; replies are matched to requests by "id"
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.listener = asyncio.create_task(self.listen())
+
+    async def listen(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("server closed the connection"))
+
+    async def request(self, message):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write((json.dumps({**message, "id": request_id}) + "\n").encode())
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.listener.cancel()
+
+
+async def play_one_game(conn, engine, depth, latencies, errors, rng):
+    response = await conn.request({"op": "new", "engine": engine, "depth": depth})
+    if not response["ok"]:
+        errors.append(response["error"])
+        return
+    game_id = response["game"]
+    board = response["board"]
+    while not response["over"]:
+        valid_moves = [c for c in range(len(board[0])) if board[0][c] == 0]
+        start = time.perf_counter()
+        response = await conn.request({"op": "move", "game": game_id, "col": rng.choice(valid_moves)})
+        if not response["ok"]:
+            errors.append(response["error"])
+            break
+        latencies.append(time.perf_counter() - start)
+        board = response["board"]
+    await conn.request({"op": "close", "game": game_id})
+
+
+async def run_client(host, port, games, engine, depth, latencies, errors, seed):
+    reader, writer = await asyncio.open_connection(host, port)
+    conn = Connection(reader, writer)
+    rng = random.Random(seed)
+    try:
+        await asyncio.gather(*(play_one_game(conn, engine, depth, latencies, errors, rng)
+                               for _ in range(games)))
+    finally:
+        await conn.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def main(host, port, clients, games, engine, depth, seed):
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(host, port, games, engine, depth, latencies, errors, seed + i)
+                           for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    print(f"Games: {clients * games} over {clients} connections in {elapsed:.2f}s")
+    print(f"Moves: {len(latencies)} ({len(latencies) / elapsed:.1f} moves/s)")
+    print(f"Latency p50: {percentile(latencies, 0.50) * 1000:.1f}ms  "
+          f"p95: {percentile(latencies, 0.95) * 1000:.1f}ms  "
+          f"p99: {percentile(latencies, 0.99) * 1000:.1f}ms")
+    if errors:
+        print(f"Errors: {len(errors)} (first: {errors[0]})")
+
+    reader, writer = await asyncio.open_connection(host, port)
+    conn = Connection(reader, writer)
+    stats = await conn.request({"op": "stats"})
+    await conn.close()
+    cache = stats["cache"]
+    print(f"Server cache: hit rate {cache['hit_rate']:.1%}, merge rate {cache['merge_rate']:.1%}, "
+          f"{cache['evictions']} evictions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the Connect Four game server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--clients", type=int, default=10, help="concurrent connections")
+    parser.add_argument("--games", type=int, default=10, help="concurrent games per connection")
+    parser.add_argument("--engine", default="alphabeta")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.clients, args.games, args.engine, args.depth, args.seed))
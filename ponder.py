@@ -0,0 +1,111 @@
+# Pondering: search on the player's time.
+#
+# After the AI moves, the positions reachable by each player reply are searched
+# in background processes, most likely reply first. Only as many searches as
+# there are workers are handed to the pool at once, and each one that finishes
+# starts the next, so every submitted search is running (a process pool marks
+# more futures as running than it has workers, so cancel() cannot tell).
+# When the player moves, the answer for that reply is used as soon as it is
+# ready; a search that is still running is simply waited for rather than
+# started over. A reply still in the queue is dropped and the caller searches
+# the position itself.
+#
+# The CPU budget is the fraction of the machine's cores given to pondering.
+# Workers also run at a lower priority so the render loop stays responsive.
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from ConnectFour import COLS, drop_piece, evaluate_board, get_next_open_row, is_full, is_valid_move
+
+PONDER_CPU_BUDGET = 0.5
+PONDER_NICENESS = 10
+
+
+def lower_priority():
+    try:
+        os.nice(PONDER_NICENESS)
+    except (AttributeError, OSError):
+        pass  # Not supported on this platform
+
+
+def ponder_workers(cpu_budget):
+    return max(1, min(COLS, int((os.cpu_count() or 1) * cpu_budget)))
+
+
+# Player replies to `board`, most likely first. The player minimizes
+# evaluate_board, so the lower a reply scores the more likely it is.
+def likely_replies(board):
+    replies = []
+    for col in range(COLS):
+        if is_valid_move(board, col):
+            child_state = board.copy()
+            drop_piece(child_state, get_next_open_row(board, col), col, 1)  # Player's move (Player = 1)
+            replies.append((evaluate_board(child_state), col, child_state))
+    replies.sort(key=lambda reply: reply[0])
+    return [(col, child_state) for _, col, child_state in replies]
+
+
+class Ponderer:
+    # `search(board, *args)` must be a module-level function so it can be sent
+    # to the worker processes
+    def __init__(self, search, *args, cpu_budget=PONDER_CPU_BUDGET, max_replies=COLS):
+        self.search = search
+        self.args = args
+        self.max_replies = max_replies
+        self.workers = ponder_workers(cpu_budget)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=lower_priority)
+        self.lock = threading.RLock()  # Done-callbacks run in the executor's thread (or inline on cancel)
+        self.queue = []  # Replies still to search, most likely first: (position after the reply, board)
+        self.pending = {}  # Position after the reply -> future of the AI answer, for submitted searches
+        self.busy = 0  # Submitted searches not finished yet, including abandoned ones still running
+        self.hits = 0
+        self.misses = 0
+
+    # Start searching the answers to the player's likely replies
+    def start(self, board):
+        with self.lock:
+            self.cancel()
+            self.queue = [(child_state.tobytes(), child_state)
+                          for _, child_state in likely_replies(board)[:self.max_replies] if not is_full(child_state)]
+            self._submit()
+
+    # Hand queued replies to the pool while a worker is free
+    def _submit(self):
+        while self.busy < self.workers and self.queue:
+            key, child_state = self.queue.pop(0)
+            self.busy += 1
+            future = self.executor.submit(self.search, child_state, *self.args)
+            self.pending[key] = future
+            future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        with self.lock:
+            self.busy -= 1
+            self._submit()
+
+    # The pondered answer for the position after the player's move, waiting for
+    # it if its search is running, or None if that reply was not pondered or
+    # was still queued
+    def take(self, board):
+        with self.lock:
+            future = self.pending.pop(board.tobytes(), None)
+            self.cancel()
+        if future is None or future.cancel():  # Only a search the worker has not picked up yet cancels
+            self.misses += 1
+            return None
+        self.hits += 1
+        return future.result()
+
+    # Drop every pondered search; queued ones never run, running ones finish
+    # in the background and free their worker
+    def cancel(self):
+        with self.lock:
+            self.queue = []
+            for future in self.pending.values():
+                future.cancel()
+            self.pending = {}
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
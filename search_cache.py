@@ -0,0 +1,160 @@
+# Request coalescing and result caching for AI searches.
+#
+# Many games reach the same common openings at the same time and ask for the
+# exact same search. Requests are keyed by (canonical position, engine, depth):
+# identical requests that arrive while a search is running wait on that search
+# instead of starting another, and finished results are kept in a size-bounded
+# LRU with a time-to-live.
+#
+# For the engines in SYMMETRIC_ENGINES a position and its left-right mirror
+# image get the same key: their evaluation scores the two identically, so the
+# cached column is mirrored back for the caller; when several columns tie, the
+# mirror may pick a different one of them. Other engines (the learned value
+# net is not symmetric) key on the position as it is, and so do the engines
+# reading the endgame tablebase when the server has one: its exact final
+# scores are not symmetric either.
+import asyncio
+import time
+from collections import OrderedDict
+
+SYMMETRIC_ENGINES = frozenset({"minimax", "alphabeta", "expectimax", "pvs", "threats"})
+
+
+def canonical_position(board):
+    mirrored = board[:, ::-1]
+    board_key = board.tobytes()
+    mirrored_key = mirrored.tobytes()
+    if mirrored_key < board_key:
+        return mirrored_key, True
+    return board_key, False
+
+
+# A search shared by every request waiting for the same key
+class Flight:
+    def __init__(self, give_up_at):
+        self.task = None
+        self.waiters = 0
+        self.give_up_at = give_up_at  # Latest deadline among the waiters (loop time), None for the pool default
+
+    def join(self, give_up_at):
+        self.waiters += 1
+        if self.give_up_at is not None:
+            self.give_up_at = None if give_up_at is None else max(self.give_up_at, give_up_at)
+
+    def remaining(self, now):
+        return None if self.give_up_at is None else max(0.0, self.give_up_at - now)
+
+
+class SearchCache:
+    def __init__(self, max_entries=100000, ttl=3600.0, clock=time.monotonic, deadline=None,
+                 symmetric_engines=SYMMETRIC_ENGINES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.symmetric_engines = symmetric_engines  # Engines whose mirrored positions share a key
+        self.deadline = deadline  # Seconds a caller without a deadline waits (the search's own default), None for no limit
+        self.clock = clock
+        self.results = OrderedDict()  # key -> (canonical column, expiry time)
+        self.in_flight = {}  # key -> Flight running the search
+        self.lookups = 0
+        self.hits = 0
+        self.merges = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # Returns the AI column for `board`, running `search(board, engine, depth,
+    # deadline)` (a coroutine function returning the column and the depth it
+    # reached) only when neither the cache nor an in-flight request can answer.
+    # A search cut short below `depth` answers its waiters but is not cached. `deadline` bounds how long this caller
+    # waits. The shared search gets the latest deadline of its waiters and is
+    # cancelled once every waiter has given up, so abandoned searches never
+    # reach a worker.
+    async def get(self, board, engine, depth, search, deadline=None):
+        if engine in self.symmetric_engines:
+            position, mirrored = canonical_position(board)
+        else:
+            position, mirrored = board.tobytes(), False
+        key = (position, engine, depth)
+        loop = asyncio.get_running_loop()
+        deadline = self.deadline if deadline is None else deadline
+        give_up_at = None if deadline is None else loop.time() + deadline
+        self.lookups += 1
+
+        while True:
+            col = self._lookup(key)
+            if col is not None:
+                self.hits += 1
+                break
+            flight = self.in_flight.get(key)
+            if flight is not None:
+                self.merges += 1
+            else:
+                self.misses += 1
+                flight = Flight(give_up_at)
+                canonical_board = board[:, ::-1] if mirrored else board
+                flight.task = asyncio.create_task(
+                    self._run(key, flight, search, canonical_board.copy(), engine, depth, loop))
+                flight.task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Waiters may all be gone
+                self.in_flight[key] = flight
+            flight.join(give_up_at)
+            try:
+                col = await asyncio.wait_for(asyncio.shield(flight.task), None if deadline is None
+                                             else max(0.0, give_up_at - loop.time()))
+                break
+            except asyncio.TimeoutError:
+                if flight.task.done() and give_up_at is not None and loop.time() < give_up_at:
+                    continue  # The search ran out of an earlier waiter's time; ours is not up yet
+                raise
+            finally:
+                flight.waiters -= 1
+                if flight.waiters == 0 and not flight.task.done():
+                    flight.task.cancel()  # Nobody is waiting any more
+
+        if mirrored:
+            col = board.shape[1] - 1 - col
+        return col
+
+    async def _run(self, key, flight, search, board, engine, depth, loop):
+        try:
+            col, reached = await search(board, engine, depth, flight.remaining(loop.time()))
+        finally:
+            if self.in_flight.get(key) is flight:
+                del self.in_flight[key]
+        if reached >= depth:
+            self._store(key, col)
+        return col
+
+    def _lookup(self, key):
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        col, expires_at = entry
+        if expires_at <= self.clock():
+            del self.results[key]
+            self.expirations += 1
+            return None
+        self.results.move_to_end(key)
+        return col
+
+    def _store(self, key, col):
+        self.results[key] = (col, self.clock() + self.ttl)
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = max(self.lookups, 1)
+        return {
+            "entries": len(self.results),
+            "in_flight": len(self.in_flight),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "merges": self.merges,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups,
+            "merge_rate": self.merges / lookups,
+            "eviction_rate": self.evictions / max(self.misses, 1),
+        }
@@ -0,0 +1,161 @@
+# Node and time budget for AI searches.
+#
+# Every search function calls visit_node() once per node, and every evaluation
+# function calls count_evaluations() per position scored. While a SearchGuard
+# is running a search, that count is checked against its hard node and time
+# caps, and SearchAborted unwinds the search once either is hit.
+#
+# The guard deepens one ply at a time and keeps the move of the deepest search
+# that completed, so an aborted search still plays a sensible move. Before
+# starting, it estimates the cost of the requested depth from the effective
+# branching factor measured on earlier moves (nodes at depth d over nodes at
+# depth d - 1) and lowers the depth, or refuses it, when the estimate is over
+# budget.
+import time
+
+import numpy as np
+
+DEFAULT_MAX_NODES = 200000
+DEFAULT_MAX_SECONDS = 10.0
+CHECK_INTERVAL = 256  # Nodes between two clock reads
+
+# Effective branching factors until measured (nodes per extra ply, mid-game)
+BRANCHING_PRIOR = {
+    "minimax": 7.0,
+    "alphabeta": 4.5,
+    "expectimax": 19.0,
+    "pvs": 4.0,
+    "threats": 4.0,
+    "valuenet": 4.0,
+}
+NODES_PER_SECOND_PRIOR = 3000.0
+
+
+class SearchAborted(Exception):
+    pass
+
+
+class SearchBudgetExceeded(Exception):
+    pass
+
+
+_nodes = 0
+_evaluations = 0
+_next_check = float('inf')
+_guard = None
+
+
+# Called by the search functions at every node
+def visit_node():
+    global _nodes
+    _nodes += 1
+    if _nodes >= _next_check:
+        _guard.check()
+
+
+# Called by the evaluation functions for every `n` positions scored
+def count_evaluations(n=1):
+    global _evaluations
+    _evaluations += n
+
+
+# Nodes visited by all searches so far in this process
+def nodes_visited():
+    return _nodes
+
+
+# Positions evaluated by all searches so far in this process
+def evaluations_done():
+    return _evaluations
+
+
+class SearchGuard:
+    def __init__(self, max_nodes=DEFAULT_MAX_NODES, max_seconds=DEFAULT_MAX_SECONDS, downgrade=True):
+        self.max_nodes = max_nodes
+        self.max_seconds = max_seconds
+        self.downgrade = downgrade  # Lower an over-budget depth instead of refusing it
+        self.branching = dict(BRANCHING_PRIOR)
+        self.rate = NODES_PER_SECOND_PRIOR
+        self.last_report = None
+        self.stop_nodes = None
+        self.stop_time = None
+
+    # Estimated nodes for a search of `depth` plies, deepening from depth 1
+    def estimate(self, board, engine, depth):
+        b = self.branching.get(engine, BRANCHING_PRIOR["minimax"])
+        depth = min(depth, int(np.count_nonzero(board == 0)))  # The search stops at a full board
+        return sum(b ** d for d in range(depth + 1))
+
+    def affordable(self, nodes):
+        return nodes <= self.max_nodes and nodes / self.rate <= self.max_seconds
+
+    # Deepest depth up to `depth` whose estimated cost is within budget
+    def plan(self, board, engine, depth):
+        planned = depth
+        while planned > 1 and not self.affordable(self.estimate(board, engine, planned)):
+            planned -= 1
+        if planned < depth and not self.downgrade:
+            raise SearchBudgetExceeded(
+                f"depth {depth} with {engine} would take about {self.estimate(board, engine, depth):.0f} nodes; "
+                f"the budget is {self.max_nodes} nodes and {self.max_seconds:g}s (depth {planned} fits)")
+        return planned
+
+    def check(self):
+        global _next_check
+        if _nodes >= self.stop_nodes or time.perf_counter() >= self.stop_time:
+            raise SearchAborted()
+        _next_check = min(self.stop_nodes, _nodes + CHECK_INTERVAL)
+
+    def arm(self, nodes, seconds):
+        global _guard, _next_check
+        self.stop_nodes = _nodes + nodes
+        self.stop_time = time.perf_counter() + seconds
+        _guard = self
+        _next_check = min(self.stop_nodes, _nodes + CHECK_INTERVAL)
+
+    def disarm(self):
+        global _guard, _next_check
+        _guard = None
+        _next_check = float('inf')
+
+    # Run `search(board, depth, *args)` within budget and return its result for
+    # the deepest depth that completed. Depth 1 always runs to completion so
+    # there is always a move.
+    def search(self, search, board, engine, depth, *args):
+        planned = self.plan(board, engine, depth)
+        start_nodes, start_time = _nodes, time.perf_counter()
+        result, reached, aborted, previous = None, 0, False, None
+        for d in range(1, planned + 1):
+            before = _nodes
+            if d > 1:
+                self.arm(self.max_nodes - (_nodes - start_nodes),
+                         self.max_seconds - (time.perf_counter() - start_time))
+            try:
+                result = search(board, d, *args)
+            except SearchAborted:
+                aborted = True
+                break
+            finally:
+                self.disarm()
+            reached = d
+            visited = _nodes - before
+            if previous and visited > previous:
+                self.branching[engine] = 0.7 * self.branching.get(engine, visited / previous) + 0.3 * visited / previous
+            previous = visited
+            used_nodes, used_time = _nodes - start_nodes, time.perf_counter() - start_time
+            if used_nodes >= CHECK_INTERVAL:
+                self.rate = used_nodes / used_time
+            if d < planned:
+                next_nodes = visited * self.branching.get(engine, BRANCHING_PRIOR["minimax"])
+                if used_nodes + next_nodes > self.max_nodes or used_time + next_nodes / self.rate > self.max_seconds:
+                    break  # The next depth would not finish within budget
+
+        self.last_report = {
+            "requested": depth,
+            "planned": planned,
+            "reached": reached,
+            "aborted": aborted,
+            "nodes": _nodes - start_nodes,
+            "seconds": time.perf_counter() - start_time,
+        }
+        return result
@@ -0,0 +1,273 @@
+# Search tree kept between moves.
+#
+# ai_move_with_pruning and expect_maximize start every move from scratch, even
+# though the position after the AI's move and the player's reply was already
+# searched one turn earlier. ReusableSearch keeps the results of its searches in
+# a tree of nodes, one per position, and on the next move makes the node of the
+# line actually played the new root. Freeing the rest of the old tree is O(n) in
+# its size, so it is not done on the spot: the dropped part goes on a free list
+# that release() works through a batch at a time, while the player is thinking.
+#
+# A stored result answers a node outright when it was searched at least as deep
+# as now needed ("reused", saving the nodes it took to compute). Otherwise its
+# best move is tried first ("guided"), which makes alpha-beta cut off sooner.
+#
+# Memory is bounded: once the tree and the dropped nodes not freed yet hold as
+# many nodes as the budget allows, new positions are still searched but no
+# longer stored.
+import sys
+
+import numpy as np
+
+from ConnectFour import (ROWS, COLS, drop_piece, evaluate_board, evaluate_leaf, get_next_open_row, is_full,
+                         is_valid_move)
+from search_guard import visit_node
+
+SEARCH_TREE_MEMORY_MB = 64
+RELEASE_BATCH = 20000  # Dropped nodes freed per release() call
+
+EXACT, LOWER, UPPER = 0, 1, 2  # What a stored alpha-beta value is: exact, or a bound
+
+
+class Node:
+    __slots__ = ("depth", "value", "flag", "best", "children", "size", "work")
+
+    def __init__(self):
+        self.depth = -1  # Depth of the stored result; -1 while nothing is stored
+        self.value = 0
+        self.flag = EXACT
+        self.best = None
+        self.children = None  # Column played -> Node
+        self.size = 1  # Nodes in this subtree, this one included
+        self.work = 0  # Nodes visited to compute the stored result
+
+
+# Approximate memory per stored node: the node itself, its value (an int or
+# float object of its own), and its share of its parent's children dict, which
+# often holds only about three children once alpha-beta has cut the rest off
+NODE_BYTES = sys.getsizeof(Node()) + sys.getsizeof(1 << 30) + sys.getsizeof(dict.fromkeys(range(5))) // 3
+
+
+class ReusableSearch:
+    def __init__(self, engine="alphabeta", max_memory_mb=SEARCH_TREE_MEMORY_MB):
+        if engine not in ("alphabeta", "expectimax"):
+            raise ValueError(f"no reusable search for engine {engine!r}")
+        self.engine = engine
+        self.max_nodes = max(1, int(max_memory_mb * 1024 * 1024 // NODE_BYTES))
+        self.root = Node()
+        self.root_board = None
+        self.stored = 1
+        self.nodes = 0
+        self.reused = 0
+        self.saved = 0
+        self.guided = 0
+        self.last_report = None
+        self.garbage = []  # Subtrees dropped by advance(), waiting to be freed by release()
+        self.dropped = 0  # Nodes in those subtrees
+        self.sizes_stale = False  # An interrupted search attached nodes without updating sizes
+
+    # Move the root to `board`. Reuses the subtree when `board` is the root
+    # position plus the AI's move and the player's reply; otherwise starts over.
+    def advance(self, board):
+        node = None
+        if self.root_board is not None and not np.any((self.root_board != 0) & (self.root_board != board)):
+            added = np.argwhere((self.root_board == 0) & (board != 0))
+            if len(added) == 0:
+                node = self.root
+            elif len(added) == 2:
+                cols = {int(board[r][c]): int(c) for r, c in added}
+                if set(cols) == {-1, 1}:
+                    parent, node = None, self.root
+                    for piece in (-1, 1):  # AI's move, then the player's reply
+                        parent, node = node, node.children.get(cols[piece]) if node.children else None
+                        if node is None:
+                            break
+                    if node is not None:
+                        del parent.children[cols[1]]  # Keep the new root out of the part being freed
+        if node is None:
+            node, kept = Node(), 0
+        else:
+            if self.sizes_stale:
+                self.recount(node)
+            kept = node.size
+        self.sizes_stale = False
+        if node is not self.root:
+            self.garbage.append(self.root)
+            self.dropped += self.stored - kept  # `stored` stays exact even when sizes were stale
+        self.root = node
+        self.stored = node.size
+        self.root_board = board.copy()
+
+    # Free up to `batch` nodes dropped by advance(); returns whether any are left
+    def release(self, batch=RELEASE_BATCH):
+        garbage = self.garbage
+        while garbage and batch > 0:
+            node = garbage.pop()
+            self.dropped -= 1
+            if node.children:
+                garbage.extend(node.children.values())
+                node.children = None
+            batch -= 1
+        return bool(garbage)
+
+    def recount(self, node):
+        node.size = 1 + sum(self.recount(child) for child in node.children.values()) if node.children else 1
+        return node.size
+
+    def ai_move(self, board, depth):
+        self.advance(board)
+        self.release()  # In case the player moved before the last dropped nodes were freed
+        self.nodes = self.reused = self.saved = self.guided = 0
+        try:
+            if self.engine == "expectimax":
+                col, _ = self.expect_maximize(self.root, board, depth)
+            else:
+                col, _ = self.maximize(self.root, board, depth, -float('inf'), float('inf'))
+        except BaseException:
+            self.sizes_stale = True  # E.g. stopped by the search budget half-way through
+            raise
+        self.last_report = {
+            "nodes": self.nodes,
+            "reused": self.reused,
+            "saved": self.saved,
+            "guided": self.guided,
+            "stored": self.stored,
+            "memory_kb": self.stored * NODE_BYTES // 1024,
+        }
+        return col
+
+    def child(self, node, col):
+        child = node.children.get(col) if node.children else None
+        if child is None:
+            child = Node()
+            if self.stored + self.dropped < self.max_nodes:
+                if node.children is None:
+                    node.children = {}
+                node.children[col] = child
+                self.stored += 1
+        return child
+
+    def store(self, node, depth, value, best, work, flag=EXACT):
+        node.depth, node.value, node.best, node.work, node.flag = depth, value, best, work, flag
+        if node.children:
+            node.size = 1 + sum(child.size for child in node.children.values())
+
+    def reuse(self, node):
+        self.reused += 1
+        self.saved += node.work
+        return node.best, node.value
+
+    def ordered_moves(self, node, state):
+        valid_moves = [c for c in range(COLS) if is_valid_move(state, c)]
+        if node.best in valid_moves:
+            self.guided += 1
+            valid_moves.remove(node.best)
+            valid_moves.insert(0, node.best)  # Best move from the earlier search first
+        return valid_moves
+
+    def leaf(self, node, state, depth):
+        evaluation = evaluate_leaf(state)
+        self.store(node, ROWS * COLS if is_full(state) else depth, evaluation, None, 1)
+        return None, evaluation
+
+    def maximize(self, node, state, depth, alpha, beta):
+        visit_node()
+        self.nodes += 1
+        if node.depth >= depth and (node.flag == EXACT or
+                                    (node.flag == LOWER and node.value >= beta) or
+                                    (node.flag == UPPER and node.value <= alpha)):
+            return self.reuse(node)
+        if depth == 0 or is_full(state):  # Terminal condition
+            return self.leaf(node, state, depth)
+
+        start, alpha_orig = self.nodes, alpha
+        max_child, max_utility = None, -float('inf')
+        for col in self.ordered_moves(node, state):
+            child_state = state.copy()
+            drop_piece(child_state, get_next_open_row(state, col), col, -1)  # AI's move (AI = -1)
+            _, utility = self.minimize(self.child(node, col), child_state, depth - 1, alpha, beta)
+            if utility > max_utility:
+                max_child, max_utility = col, utility
+            alpha = max(alpha, max_utility)
+            if beta <= alpha:
+                break  # Prune the remaining branches
+
+        flag = UPPER if max_utility <= alpha_orig else LOWER if max_utility >= beta else EXACT
+        self.store(node, depth, max_utility, max_child, self.nodes - start + 1, flag)
+        return max_child, max_utility
+
+    def minimize(self, node, state, depth, alpha, beta):
+        visit_node()
+        self.nodes += 1
+        if node.depth >= depth and (node.flag == EXACT or
+                                    (node.flag == LOWER and node.value >= beta) or
+                                    (node.flag == UPPER and node.value <= alpha)):
+            return self.reuse(node)
+        if depth == 0 or is_full(state):  # Terminal condition
+            return self.leaf(node, state, depth)
+
+        start, beta_orig = self.nodes, beta
+        min_child, min_utility = None, float('inf')
+        for col in self.ordered_moves(node, state):
+            child_state = state.copy()
+            drop_piece(child_state, get_next_open_row(state, col), col, 1)  # Player's move (Player = 1)
+            _, utility = self.maximize(self.child(node, col), child_state, depth - 1, alpha, beta)
+            if utility < min_utility:
+                min_child, min_utility = col, utility
+            beta = min(beta, min_utility)
+            if beta <= alpha:
+                break  # Prune the remaining branches
+
+        flag = LOWER if min_utility >= beta_orig else UPPER if min_utility <= alpha else EXACT
+        self.store(node, depth, min_utility, min_child, self.nodes - start + 1, flag)
+        return min_child, min_utility
+
+    # Same expectation as ConnectFour.expect_maximize/expect_minimize; children
+    # are keyed by the column the piece actually lands in
+    def expect_value(self, node, state, col, piece, depth):
+        expected_utility = 0
+        for offset, prob in ((0, 0.6), (-1, 0.2), (1, 0.2)):  # Current column, left, right
+            neighbor_col = col + offset
+            if 0 <= neighbor_col < COLS and is_valid_move(state, neighbor_col):
+                neighbor_state = state.copy()
+                drop_piece(neighbor_state, get_next_open_row(state, neighbor_col), neighbor_col, piece)
+                search = self.expect_minimize if piece == -1 else self.expect_maximize
+                _, utility = search(self.child(node, neighbor_col), neighbor_state, depth - 1)
+                expected_utility += prob * utility
+            else:
+                expected_utility += prob * evaluate_board(state)  # Stay at current evaluation for invalid moves
+        return expected_utility
+
+    def expect_maximize(self, node, state, depth):
+        visit_node()
+        self.nodes += 1
+        if node.depth >= depth:
+            return self.reuse(node)
+        if depth == 0 or is_full(state):  # Terminal condition
+            return self.leaf(node, state, depth)
+
+        start = self.nodes
+        max_child, max_utility = None, -float('inf')
+        for col in self.ordered_moves(node, state):
+            expected_utility = self.expect_value(node, state, col, -1, depth)  # AI's move (AI = -1)
+            if expected_utility > max_utility:
+                max_child, max_utility = col, expected_utility
+        self.store(node, depth, max_utility, max_child, self.nodes - start + 1)
+        return max_child, max_utility
+
+    def expect_minimize(self, node, state, depth):
+        visit_node()
+        self.nodes += 1
+        if node.depth >= depth:
+            return self.reuse(node)
+        if depth == 0 or is_full(state):  # Terminal condition
+            return self.leaf(node, state, depth)
+
+        start = self.nodes
+        min_child, min_utility = None, float('inf')
+        for col in self.ordered_moves(node, state):
+            expected_utility = self.expect_value(node, state, col, 1, depth)  # Player's move (Player = 1)
+            if expected_utility < min_utility:
+                min_child, min_utility = col, expected_utility
+        self.store(node, depth, min_utility, min_child, self.nodes - start + 1)
+        return min_child, min_utility
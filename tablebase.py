@@ -0,0 +1,375 @@
+# Endgame tablebase: exact results of near-full boards.
+#
+# Every game is played until the board is full, so its last moves are searched
+# again from scratch in every game. The tablebase stores the exact final score
+# difference (AI minus player, as calculate_final_scores counts it) with
+# perfect play from a position with at most `max_empty` empty cells. Which side
+# is to move follows from the number of empty cells, since the player always
+# moves first.
+#
+# All positions with 10 empty cells are far too many to enumerate, so the
+# generator starts from positions reached in self-play games (or game records)
+# and solves every position below them, working back from the full boards.
+# Each seed's mirror image is solved as well, so a game reaching the mirrored
+# line finds it too. The mirrored values are solved rather than copied: the
+# final count takes lines greedily in a fixed order (horizontal, vertical, /,
+# then \), so a board and its mirror image do not always score the same.
+#
+# The file holds a perfect hash table (hash and displace): each key hashes to a
+# bucket whose displacement picks a slot no other key uses, so a probe reads
+# exactly one slot. Keys are stored too, so positions that were never solved
+# are told apart. The file is memory-mapped and shared by all processes.
+#
+#   python tablebase.py build --empty 10 --games 500
+#   python tablebase.py stats
+#   python tablebase.py check
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+
+import numpy as np
+
+# Same board size and bit layout as threats.py; ConnectFour.py loads this
+# module, so the game code is only imported by the generator
+ROWS, COLS = 6, 7
+HEIGHT = ROWS + 1
+CELL_BITS = np.array([[1 << (c * HEIGHT + ROWS - 1 - r) for c in range(COLS)] for r in range(ROWS)],
+                     dtype=np.int64)
+
+FILE_MAGIC = b"C4TB"
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<4sBB2xQQQQ")  # Magic, version, max empty cells, entries, slots, buckets, bucket seed
+DEFAULT_MAX_EMPTY = 10
+LOAD_FACTOR = 0.95
+BUCKET_SIZE = 4  # Average keys per bucket
+MAX_DISPLACEMENT = 1 << 20
+SLOT_SEED = 1 << 32  # Slot seeds (SLOT_SEED + displacement) never equal a bucket seed
+
+MASK64 = (1 << 64) - 1
+
+
+class TablebaseFormatError(Exception):
+    pass
+
+
+# 64-bit hash of `key` (splitmix64 finalizer)
+def mix(key, seed):
+    x = (key + seed * 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+# Unique key of a position: AI bits plus occupied bits. Each column holds
+# (2^height - 1) + AI bits, and those ranges never overlap between heights.
+def position_key(board):
+    return int(np.sum(CELL_BITS[board == -1])) * 2 + int(np.sum(CELL_BITS[board == 1]))
+
+
+# Key of the left-right mirror image: each column's 7 bits move to column 6 - c
+def mirror_key(key):
+    return sum(((key >> (c * HEIGHT)) & 0x7F) << ((COLS - 1 - c) * HEIGHT) for c in range(COLS))
+
+
+class Tablebase:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < FILE_HEADER.size:
+            raise TablebaseFormatError(f"{path}: truncated header")
+        magic, version, self.max_empty, self.entries, self.slots, self.buckets, self.bucket_seed = \
+            FILE_HEADER.unpack_from(self.data)
+        if magic != FILE_MAGIC:
+            raise TablebaseFormatError(f"{path}: not a tablebase file")
+        if version != FORMAT_VERSION:
+            raise TablebaseFormatError(f"{path}: unsupported format version {version}")
+        offset = FILE_HEADER.size
+        if len(self.data) != offset + self.slots * 9 + self.buckets * 4:
+            raise TablebaseFormatError(f"{path}: wrong file size")
+        self.keys = np.frombuffer(self.data, np.uint64, self.slots, offset)
+        offset += self.slots * 8
+        self.displacements = np.frombuffer(self.data, np.uint32, self.buckets, offset)
+        offset += self.buckets * 4
+        self.values = np.frombuffer(self.data, np.int8, self.slots, offset)
+        self.hits = 0
+        self.misses = 0  # Probes of boards full enough for the tablebase that it does not have
+
+    # Exact final score difference (AI minus player) of `board`, or None when
+    # the position is not in the tablebase
+    def probe(self, board):
+        if np.count_nonzero(board == 0) > self.max_empty:
+            return None
+        result = self.lookup(position_key(board))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def lookup(self, key):
+        displacement = int(self.displacements[mix(key, self.bucket_seed) % self.buckets])
+        slot = mix(key, SLOT_SEED + displacement) % self.slots
+        if int(self.keys[slot]) != key:
+            return None
+        return int(self.values[slot])
+
+    def close(self):
+        self.keys = self.displacements = self.values = None  # Release the buffer before unmapping
+        self.data.close()
+
+
+_loaded = {}  # Path -> Tablebase (or None when there is no file), one per process
+
+
+# The process's tablebase for `path`, or None when the file does not exist.
+# ConnectFour.py can be loaded twice (as the script and as a module imported by
+# search_tree.py), and both copies must probe the same table and counters.
+def load(path):
+    if path not in _loaded:
+        _loaded[path] = Tablebase(path) if os.path.exists(path) else None
+    return _loaded[path]
+
+
+# Displacement of every bucket such that no two keys share a slot, or None
+# when some bucket fits nowhere
+def displace(groups, slots):
+    displacements = np.zeros(len(groups), np.uint32)
+    taken = bytearray(slots)
+    for bucket in sorted(range(len(groups)), key=lambda b: -len(groups[b])):  # Largest buckets first
+        group = groups[bucket]
+        if not group:
+            break
+        for displacement in range(MAX_DISPLACEMENT):
+            placed = {mix(key, SLOT_SEED + displacement) % slots for key in group}
+            if len(placed) == len(group) and not any(taken[slot] for slot in placed):
+                break
+        else:
+            return None
+        displacements[bucket] = displacement
+        for slot in placed:
+            taken[slot] = 1
+    return displacements
+
+
+# Perfect hash table of {key: value}: returns (slot keys, slot values,
+# displacements, bucket seed)
+def perfect_hash(table):
+    slots = max(1, int(len(table) / LOAD_FACTOR) + 1)
+    buckets = max(1, len(table) // BUCKET_SIZE)
+    for bucket_seed in range(1, SLOT_SEED):
+        groups = [[] for _ in range(buckets)]
+        for key in table:
+            groups[mix(key, bucket_seed) % buckets].append(key)
+        displacements = displace(groups, slots)
+        if displacements is not None:
+            break  # Otherwise start over with another bucket seed
+    slot_keys = np.zeros(slots, np.uint64)
+    slot_values = np.zeros(slots, np.int8)
+    for bucket, group in enumerate(groups):
+        for key in group:
+            slot = mix(key, SLOT_SEED + int(displacements[bucket])) % slots
+            slot_keys[slot] = key
+            slot_values[slot] = table[key]
+    return slot_keys, slot_values, displacements, bucket_seed
+
+
+def write_tablebase(path, table, max_empty):
+    slot_keys, slot_values, displacements, bucket_seed = perfect_hash(table)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, max_empty, len(table), len(slot_keys),
+                                 len(displacements), bucket_seed))
+        f.write(slot_keys.tobytes())
+        f.write(displacements.tobytes())
+        f.write(slot_values.tobytes())
+    os.replace(tmp, path)  # Never leave a half-written file behind
+
+
+# Exact solver. Works on a list board in place and keys positions incrementally;
+# every position it visits ends up in `table`.
+class Solver:
+    def __init__(self):
+        from ConnectFour import calculate_final_scores  # Imported here: ConnectFour.py loads this module
+        self.final_scores = calculate_final_scores
+        self.table = {}
+        self.full_boards = 0
+
+    # Solves `board` and its mirror image
+    def solve_both(self, board):
+        value = self.solve(board)
+        self.solve(board[:, ::-1])
+        return value
+
+    def solve(self, board):
+        heights = [int(np.count_nonzero(board[:, c])) for c in range(COLS)]
+        return self.value(board.tolist(), position_key(board), int(np.count_nonzero(board == 0)), heights)
+
+    def value(self, board, key, empty, heights):
+        value = self.table.get(key)
+        if value is not None:
+            return value
+        if empty == 0:
+            self.full_boards += 1
+            player_score, ai_score = self.final_scores(board, verbose=False)
+            value = ai_score - player_score
+        else:
+            piece = 1 if empty % 2 == 0 else -1  # The player moves first, so moves on an even count
+            for col in range(COLS):
+                if heights[col] < ROWS:
+                    row = ROWS - 1 - heights[col]
+                    board[row][col] = piece
+                    heights[col] += 1
+                    child = self.value(board, key + int(CELL_BITS[row][col]) * (2 if piece == -1 else 1),
+                                       empty - 1, heights)
+                    board[row][col] = 0
+                    heights[col] -= 1
+                    if value is None or (child > value if piece == -1 else child < value):
+                        value = child  # The AI maximizes the difference, the player minimizes it
+        self.table[key] = value
+        return value
+
+
+# Positions with `max_empty` empty cells from self-play with the batched
+# heuristic engine, with some random moves mixed in for variety
+def self_play_seeds(games, max_empty, depth=2, randomness=0.2, seed=0):
+    from ConnectFour import create_board, drop_piece, get_next_open_row, is_valid_move
+    from board_features import weight_vector
+    from tune_weights import batched_move
+    rng = random.Random(seed)
+    weights = weight_vector()
+    for _ in range(games):
+        board = create_board()
+        piece = 1
+        while np.count_nonzero(board == 0) > max_empty:
+            valid_moves = [c for c in range(COLS) if is_valid_move(board, c)]
+            if rng.random() < randomness or np.count_nonzero(board) < 4:
+                col = rng.choice(valid_moves)
+            else:
+                col = batched_move(board, piece, weights, depth)
+            drop_piece(board, get_next_open_row(board, col), col, piece)
+            piece = -piece
+        yield board
+
+
+def record_seeds(path, max_empty):
+    from game_record import read_games, replay
+    for record in read_games(path):
+        if record.first_piece != 1:
+            continue  # Side to move is only implied by the cell count when the player moved first
+        for board, _, _, _ in replay(record):
+            if np.count_nonzero(board == 0) == max_empty:
+                yield board.copy()
+                break
+
+
+def build(output, max_empty=DEFAULT_MAX_EMPTY, games=500, records=None, seed=0):
+    seeds = record_seeds(records, max_empty) if records else self_play_seeds(games, max_empty, seed=seed)
+    solver = Solver()
+    start = time.perf_counter()
+    count = 0
+    for board in seeds:
+        solver.solve_both(board)
+        count += 1
+    print(f"Solved {len(solver.table)} positions below {count} seed positions "
+          f"({solver.full_boards} full boards) in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    write_tablebase(output, solver.table, max_empty)
+    print(f"Tablebase written to {output} ({os.path.getsize(output) / 1024 / 1024:.1f} MB, "
+          f"hashed in {time.perf_counter() - start:.1f}s)")
+    return solver.table
+
+
+# Exact result of `board` by plain minimax on the game's own board functions
+def brute_force(board, piece):
+    from ConnectFour import calculate_final_scores, drop_piece, get_next_open_row, is_valid_move
+    valid_moves = [c for c in range(COLS) if is_valid_move(board, c)]
+    if not valid_moves:
+        player_score, ai_score = calculate_final_scores(board, verbose=False)
+        return ai_score - player_score
+    values = []
+    for col in valid_moves:
+        child = board.copy()
+        drop_piece(child, get_next_open_row(child, col), col, piece)
+        values.append(brute_force(child, -piece))
+    return max(values) if piece == -1 else min(values)
+
+
+# Checks the solver against brute force on random positions with `empty`
+# empty cells, then writes the solved table and reads every entry back
+def check(positions=20, empty=6, seed=0):
+    import tempfile
+    from ConnectFour import create_board, drop_piece, get_next_open_row, is_valid_move
+    rng = random.Random(seed)
+    solver = Solver()
+    boards = []
+    for _ in range(positions):
+        board = create_board()
+        piece = 1
+        while np.count_nonzero(board == 0) > empty:
+            col = rng.choice([c for c in range(COLS) if is_valid_move(board, c)])
+            drop_piece(board, get_next_open_row(board, col), col, piece)
+            piece = -piece
+        boards.append(board)
+        for position in (board, board[:, ::-1]):
+            expected = brute_force(position.copy(), piece)
+            solved = solver.solve(position)
+            if solved != expected:
+                raise AssertionError(f"solver says {solved}, brute force {expected} for\n{position}")
+    print(f"Solver matches brute force on {positions} positions with {empty} empty cells and their mirrors")
+
+    missing = [key for key in solver.table if mirror_key(key) not in solver.table]
+    if missing:
+        raise AssertionError(f"{len(missing)} solved positions lack their mirror image")
+    path = os.path.join(tempfile.mkdtemp(), "check.c4tb")
+    write_tablebase(path, solver.table, empty)
+    tablebase = Tablebase(path)
+    try:
+        for key, value in solver.table.items():
+            if tablebase.lookup(key) != value:
+                raise AssertionError(f"key {key:#x}: stored {value}, read back {tablebase.lookup(key)}")
+        for board in boards:
+            if tablebase.probe(board[:, ::-1]) != solver.table[position_key(board[:, ::-1])]:
+                raise AssertionError(f"mirror image probe failed for\n{board}")
+        unknown = [key for key in (rng.getrandbits(49) for _ in range(1000)) if key not in solver.table]
+        if any(tablebase.lookup(key) is not None for key in unknown):
+            raise AssertionError("lookup found a position that was never solved")
+    finally:
+        tablebase.close()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    print(f"All {len(solver.table)} positions read back from the tablebase file, unknown keys miss")
+
+
+def stats(path):
+    tablebase = Tablebase(path)
+    print(f"{path}: {tablebase.entries} positions with at most {tablebase.max_empty} empty cells, "
+          f"{tablebase.slots} slots, {tablebase.buckets} buckets, {len(tablebase.data) / 1024 / 1024:.1f} MB")
+    tablebase.close()
+
+
+if __name__ == "__main__":
+    from ConnectFour import TABLEBASE_FILE
+    parser = argparse.ArgumentParser(description="Build and inspect the endgame tablebase")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="solve endgames and write the tablebase")
+    build_parser.add_argument("--empty", type=int, default=DEFAULT_MAX_EMPTY, help="empty cells in the seed positions")
+    build_parser.add_argument("--games", type=int, default=500, help="self-play games to take seed positions from")
+    build_parser.add_argument("--records", default=None, help="take seed positions from a game record file instead")
+    build_parser.add_argument("--output", default=TABLEBASE_FILE)
+    build_parser.add_argument("--seed", type=int, default=0)
+    stats_parser = commands.add_parser("stats", help="describe a tablebase file")
+    stats_parser.add_argument("path", nargs="?", default=TABLEBASE_FILE)
+    check_parser = commands.add_parser("check", help="test the solver and the file format")
+    check_parser.add_argument("--positions", type=int, default=20, help="random positions to compare with brute force")
+    check_parser.add_argument("--empty", type=int, default=6, help="empty cells in those positions")
+    check_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.command == "build":
+        build(args.output, args.empty, args.games, args.records, args.seed)
+    elif args.command == "check":
+        check(args.positions, args.empty, args.seed)
+    else:
+        stats(args.path)
@@ -0,0 +1,243 @@
+# Threat-space analysis for Connect Four.
+#
+# Positions are converted to bitboards (7 bits per column, bottom row first,
+# one spare bit on top of every column) so that the cells completing a four for
+# either side can be found with a handful of shifts. The search in this module
+# uses them to
+#   - restrict a node to its forced moves: complete a four if possible, else
+#     block the opponent's playable four,
+#   - skip moves that play directly under an opponent's threat,
+#   - add odd/even threat parity (zugzwang) terms to evaluate_board.
+#
+# The game here is played until the board is full and scored by counting fours,
+# so a completed four is a point rather than the end of the game: the forced
+# move rules are a pruning heuristic, not a proof. calculate_final_scores only
+# counts diagonal fours for the player, who also always moves first, so only
+# the first player's diagonal threats are taken into account.
+import random
+import sys
+
+import numpy as np
+
+from ConnectFour import (ROWS, COLS, create_board, drop_piece, get_next_open_row, is_full,
+                         is_valid_move, evaluate_board, calculate_final_scores)
+from search_guard import visit_node
+
+HEIGHT = ROWS + 1  # Bits per column, including the spare top bit
+BOTTOM_MASK = sum(1 << (c * HEIGHT) for c in range(COLS))
+BOARD_MASK = BOTTOM_MASK * ((1 << ROWS) - 1)
+COLUMN_MASKS = [((1 << ROWS) - 1) << (c * HEIGHT) for c in range(COLS)]
+
+# Bit of every board cell; board row 0 is the top of the column
+CELL_BITS = np.array([[1 << (c * HEIGHT + ROWS - 1 - r) for c in range(COLS)] for r in range(ROWS)],
+                     dtype=np.int64)
+
+# Odd rows (1st, 3rd, 5th from the bottom) of every column
+ODD_ROWS_MASK = sum(1 << (c * HEIGHT + r) for c in range(COLS) for r in range(0, ROWS, 2))
+EVEN_ROWS_MASK = BOARD_MASK & ~ODD_ROWS_MASK
+
+GOOD_THREAT_WEIGHT = 4  # Threat on the side's own parity: odd for the first player, even for the second
+OTHER_THREAT_WEIGHT = 1  # Threat on the other parity
+
+
+def bitboards(board):
+    player = int(np.sum(CELL_BITS[board == 1]))
+    ai = int(np.sum(CELL_BITS[board == -1]))
+    return player, ai
+
+
+# Empty cells that would complete a four for `pieces`
+def winning_cells(pieces, mask, diagonals=True):
+    # Vertical
+    r = (pieces << 1) & (pieces << 2) & (pieces << 3)
+    # Horizontal, then both diagonals
+    for shift in ((HEIGHT, HEIGHT - 1, HEIGHT + 1) if diagonals else (HEIGHT,)):
+        p = (pieces << shift) & (pieces << 2 * shift)
+        r |= p & (pieces << 3 * shift)
+        r |= p & (pieces >> shift)
+        p = (pieces >> shift) & (pieces >> 2 * shift)
+        r |= p & (pieces << shift)
+        r |= p & (pieces >> 3 * shift)
+    return r & (BOARD_MASK ^ mask)
+
+
+# Cells where the next piece in each column would land
+def playable_cells(mask):
+    return (mask + BOTTOM_MASK) & BOARD_MASK
+
+
+def columns_of(cells):
+    return [c for c in range(COLS) if cells & COLUMN_MASKS[c]]
+
+
+def bit_count(x):
+    return bin(x).count("1")
+
+
+# Moves worth searching for `piece` (1 = player, -1 = AI): a move that completes
+# a four, else the moves that block the opponent's playable fours, else every
+# move that does not land directly under an opponent threat. Falls back to all
+# valid moves when every move is bad.
+def candidate_moves(board, piece, first_piece=1):
+    player, ai = bitboards(board)
+    mine, theirs = (player, ai) if piece == 1 else (ai, player)
+    mask = player | ai
+    playable = playable_cells(mask)
+
+    wins = winning_cells(mine, mask, piece == first_piece) & playable
+    if wins:
+        return columns_of(wins)
+    opponent_wins = winning_cells(theirs, mask, -piece == first_piece)
+    blocks = opponent_wins & playable
+    if blocks:
+        return columns_of(blocks)
+    unsafe = (opponent_wins >> 1) & playable  # Playing here hands the opponent the cell above
+    safe = columns_of(playable & ~unsafe)
+    return safe or columns_of(playable)
+
+
+# Threat parity term, from the AI's point of view. Threats the opponent can
+# already play are left to the search; the rest decide the endgame by zugzwang.
+def threat_parity(board, first_piece=1):
+    player, ai = bitboards(board)
+    mask = player | ai
+    playable = playable_cells(mask)
+    score = 0
+    for pieces, sign, piece in ((ai, 1, -1), (player, -1, 1)):
+        threats = winning_cells(pieces, mask, piece == first_piece) & ~playable
+        good_rows = ODD_ROWS_MASK if piece == first_piece else EVEN_ROWS_MASK
+        score += sign * (GOOD_THREAT_WEIGHT * bit_count(threats & good_rows) +
+                         OTHER_THREAT_WEIGHT * bit_count(threats & ~good_rows))
+    return score
+
+
+# evaluate_board plus threat parity
+def evaluate_board_threats(board, first_piece=1):
+    return evaluate_board(board) + threat_parity(board, first_piece)
+
+
+class NodeLimitReached(Exception):
+    pass
+
+
+# Alpha-beta search with optional threat pruning and threat evaluation. With
+# `use_threats` off it searches exactly like maximize_with_pruning, which makes
+# it a fair baseline when comparing at equal node counts.
+class ThreatSearch:
+    def __init__(self, use_threats=True, first_piece=1, max_nodes=None):
+        self.use_threats = use_threats
+        self.first_piece = first_piece
+        self.max_nodes = max_nodes
+        self.nodes = 0
+
+    def evaluate(self, state):
+        if self.use_threats:
+            return evaluate_board_threats(state, self.first_piece)
+        return evaluate_board(state)
+
+    def moves(self, state, piece):
+        if self.use_threats:
+            return candidate_moves(state, piece, self.first_piece)
+        return [c for c in range(COLS) if is_valid_move(state, c)]
+
+    def visit(self):
+        visit_node()
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise NodeLimitReached()
+
+    def maximize(self, state, depth, alpha, beta):
+        self.visit()
+        if depth == 0 or is_full(state):  # Terminal condition
+            return None, self.evaluate(state)
+
+        max_child, max_utility = None, -float('inf')
+        for col in self.moves(state, -1):
+            child_state = state.copy()
+            drop_piece(child_state, get_next_open_row(state, col), col, -1)  # AI's move (AI = -1)
+            _, utility = self.minimize(child_state, depth - 1, alpha, beta)
+            if utility > max_utility:
+                max_child, max_utility = col, utility
+            alpha = max(alpha, max_utility)
+            if beta <= alpha:
+                break  # Prune the remaining branches
+        return max_child, max_utility
+
+    def minimize(self, state, depth, alpha, beta):
+        self.visit()
+        if depth == 0 or is_full(state):  # Terminal condition
+            return None, self.evaluate(state)
+
+        min_child, min_utility = None, float('inf')
+        for col in self.moves(state, 1):
+            child_state = state.copy()
+            drop_piece(child_state, get_next_open_row(state, col), col, 1)  # Player's move (Player = 1)
+            _, utility = self.maximize(child_state, depth - 1, alpha, beta)
+            if utility < min_utility:
+                min_child, min_utility = col, utility
+            beta = min(beta, min_utility)
+            if beta <= alpha:
+                break  # Prune the remaining branches
+        return min_child, min_utility
+
+    # Deepen until the node budget runs out; returns the move of the deepest
+    # completed search
+    def best_move(self, board, max_depth=ROWS * COLS):
+        self.nodes = 0
+        best = None
+        max_depth = min(max_depth, int(np.count_nonzero(board == 0)))
+        for depth in range(1, max_depth + 1):
+            try:
+                col, _ = self.maximize(board, depth, -float('inf'), float('inf'))
+            except NodeLimitReached:
+                break
+            best = col
+        if best is None:  # Budget too small for even one ply
+            best = self.moves(board, -1)[0]
+        return best
+
+
+def ai_move_threats(board, depth):
+    col, _ = ThreatSearch().maximize(board, depth, -float('inf'), float('inf'))
+    return col
+
+
+# Self-play match at equal node budgets: threat search against the same search
+# without threat analysis, each side playing first in half the games. Returns
+# the threat engine's (wins, losses, draws).
+def match(games=10, max_nodes=2000, seed=0):
+    rng = random.Random(seed)
+    wins = losses = draws = 0
+    for game in range(games):
+        threat_first = game % 2 == 0
+        board = create_board()
+        piece = 1
+        for _ in range(2):  # Random opening so the games differ
+            col = rng.choice([c for c in range(COLS) if is_valid_move(board, c)])
+            drop_piece(board, get_next_open_row(board, col), col, piece)
+            piece = -piece
+        while not is_full(board):
+            threat_to_move = (piece == 1) == threat_first
+            # Engines search as the AI (-1); the first player sees the board negated
+            view = board if piece == -1 else -board
+            first_piece = 1 if piece == -1 else -1
+            col = ThreatSearch(threat_to_move, first_piece, max_nodes).best_move(view)
+            drop_piece(board, get_next_open_row(board, col), col, piece)
+            piece = -piece
+        player_score, ai_score = calculate_final_scores(board, verbose=False)
+        threat_score, other_score = (player_score, ai_score) if threat_first else (ai_score, player_score)
+        if threat_score > other_score:
+            wins += 1
+        elif threat_score < other_score:
+            losses += 1
+        else:
+            draws += 1
+    return wins, losses, draws
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    max_nodes = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    wins, losses, draws = match(games, max_nodes)
+    print(f"Threat search vs plain alpha-beta at {max_nodes} nodes/move over {games} games: "
+          f"{wins} wins, {losses} losses, {draws} draws")
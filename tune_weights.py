@@ -0,0 +1,147 @@
+# Tune the evaluate_board weights by self-play (SPSA).
+#
+# Every iteration perturbs all weights at once in a random direction, plays
+# the two perturbed weight vectors against each other over a batch of headless
+# games, and steps towards whichever did better. Games run across a process
+# pool; each move is a shallow minimax whose leaves are all scored in one
+# batched NumPy evaluation. Progress is checkpointed after every iteration and
+# the result is written to weights.json, which ConnectFour.py loads at startup.
+import argparse
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ConnectFour import (COLS, DEFAULT_WEIGHTS, WEIGHTS_FILE, calculate_final_scores, create_board,
+                         drop_piece, get_next_open_row, is_full, is_valid_move)
+from board_features import WEIGHT_NAMES, heuristic_features, weight_vector
+
+OPENING_MOVES = 4  # Random moves at the start of every game so games differ
+
+
+# Minimax tree of `board` down to `depth`, as nested (col, subtree) lists whose
+# leaves are indices into `leaves`
+def expand(board, to_move, depth, leaves):
+    if depth == 0 or is_full(board):
+        leaves.append(board)
+        return len(leaves) - 1
+    children = []
+    for col in range(COLS):
+        if is_valid_move(board, col):
+            child_state = board.copy()
+            drop_piece(child_state, get_next_open_row(board, col), col, to_move)
+            children.append((col, expand(child_state, -to_move, depth - 1, leaves)))
+    return children
+
+
+def backup(node, values, maximizing):
+    if isinstance(node, int):
+        return values[node]
+    child_values = [backup(child, values, not maximizing) for _, child in node]
+    return max(child_values) if maximizing else min(child_values)
+
+
+# Best column for `piece` under `weights` (a vector in WEIGHT_NAMES order),
+# scoring every leaf of the search with one batched evaluation
+def batched_move(board, piece, weights, depth=2):
+    leaves = []
+    root = expand(board, piece, depth, leaves)
+    values = -piece * (heuristic_features(np.array(leaves)) @ weights)  # evaluate_board is the AI's (-1) view
+    scores = [backup(child, values, False) for _, child in root]
+    return root[int(np.argmax(scores))][0]
+
+
+# Play one game; `first` and `second` are the weight vectors of the player
+# moving first (piece 1) and second (piece -1). Returns first's score: 1, 0.5 or 0.
+def play_headless(first, second, opening, depth):
+    board = create_board()
+    piece = 1
+    for col in opening:
+        drop_piece(board, get_next_open_row(board, col), col, piece)
+        piece = -piece
+    while not is_full(board):
+        col = batched_move(board, piece, first if piece == 1 else second, depth)
+        drop_piece(board, get_next_open_row(board, col), col, piece)
+        piece = -piece
+    player_score, ai_score = calculate_final_scores(board, verbose=False)
+    return 1.0 if player_score > ai_score else 0.0 if player_score < ai_score else 0.5
+
+
+# Both colors from the same opening; returns the score of `a` out of 2
+def play_pair(a, b, opening, depth):
+    return play_headless(a, b, opening, depth) + (1.0 - play_headless(b, a, opening, depth))
+
+
+def random_opening(rng):
+    board = create_board()
+    opening = []
+    piece = 1
+    for _ in range(OPENING_MOVES):
+        col = rng.choice([c for c in range(COLS) if is_valid_move(board, c)])
+        drop_piece(board, get_next_open_row(board, col), col, piece)
+        opening.append(col)
+        piece = -piece
+    return opening
+
+
+# Score of `a` against `b` in [0, 1] over `pairs` game pairs
+def match_score(pool, a, b, pairs, depth, rng):
+    openings = [random_opening(rng) for _ in range(pairs)]
+    results = pool.map(play_pair, [a] * pairs, [b] * pairs, openings, [depth] * pairs)
+    return sum(results) / (2 * pairs)
+
+
+def save_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)  # Never leave a half-written file behind
+
+
+def tune(iterations=100, pairs=8, depth=2, workers=None, checkpoint="tune_checkpoint.json",
+         output=WEIGHTS_FILE, a=5.0, c=1.0, A=10.0, seed=0):
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state = json.load(f)
+        print(f"Resuming from {checkpoint} at iteration {state['iteration']}")
+    else:
+        state = {"iteration": 0, "theta": weight_vector(DEFAULT_WEIGHTS).tolist(), "history": []}
+    theta = np.array(state["theta"])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for k in range(state["iteration"], iterations):
+            rng = random.Random(seed * 1000003 + k)  # Reproducible after a resume
+            a_k = a / (k + 1 + A) ** 0.602
+            c_k = c / (k + 1) ** 0.101
+            delta = np.array([rng.choice((-1.0, 1.0)) for _ in WEIGHT_NAMES])
+            score = match_score(pool, theta + c_k * delta, theta - c_k * delta, pairs, depth, rng)
+            theta = theta + a_k * (2 * score - 1) / (2 * c_k * delta)
+
+            state["iteration"] = k + 1
+            state["theta"] = theta.tolist()
+            state["history"].append({"iteration": k + 1, "score": score, "theta": theta.tolist()})
+            save_json(checkpoint, state)
+            print(f"Iteration {k + 1}: plus-side score {score:.3f}, "
+                  + ", ".join(f"{name}={value:.2f}" for name, value in zip(WEIGHT_NAMES, theta)))
+
+    save_json(output, {name: round(float(value), 2) for name, value in zip(WEIGHT_NAMES, theta)})
+    print(f"Weights written to {output}")
+    return theta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the evaluate_board weights by self-play")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--pairs", type=int, default=8, help="game pairs per iteration (both colors)")
+    parser.add_argument("--depth", type=int, default=2, help="search depth of the self-play engine")
+    parser.add_argument("--workers", type=int, default=None, help="game processes (default: CPU count)")
+    parser.add_argument("--checkpoint", default="tune_checkpoint.json")
+    parser.add_argument("--output", default=WEIGHTS_FILE)
+    parser.add_argument("--step", type=float, default=5.0, help="SPSA step size (a)")
+    parser.add_argument("--perturbation", type=float, default=1.0, help="SPSA perturbation size (c)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    tune(args.iterations, args.pairs, args.depth, args.workers, args.checkpoint, args.output,
+         a=args.step, c=args.perturbation, seed=args.seed)
@@ -0,0 +1,313 @@
+# Learned value function as an alternative to evaluate_board.
+#
+# A small MLP (69 window features -> hidden ReLU layer -> 1) predicts the final
+# score difference (AI minus player) of a position. It runs on the CPU with
+# NumPy only and is trained offline from self-play games or game records.
+#
+# Evaluating one position at a time would spend most of the time in NumPy call
+# overhead, so BatchedSearch collects all children of a frontier node and
+# scores them with a single call. The same search runs with either backend:
+#
+#   python value_net.py train --games 2000
+#   python value_net.py report --depth 3 --games 20
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+
+from ConnectFour import (COLS, VALUE_NET_FILE, calculate_final_scores, create_board, drop_piece, evaluate_board,
+                         get_next_open_row, is_full, is_valid_move)
+from board_features import WINDOWS, evaluate_boards, weight_vector, window_features
+from search_guard import count_evaluations, visit_node
+
+MODEL_FILE = VALUE_NET_FILE
+HIDDEN_UNITS = 32
+
+
+class ValueNet:
+    def __init__(self, w1, b1, w2, b2):
+        self.w1, self.b1, self.w2, self.b2 = w1, b1, w2, b2
+
+    @classmethod
+    def random(cls, hidden=HIDDEN_UNITS, seed=0):
+        rng = np.random.default_rng(seed)
+        inputs = len(WINDOWS)
+        return cls(rng.normal(0, np.sqrt(2 / inputs), (inputs, hidden)), np.zeros(hidden),
+                   rng.normal(0, np.sqrt(1 / hidden), (hidden, 1)), np.zeros(1))
+
+    @classmethod
+    def load(cls, path=MODEL_FILE):
+        with np.load(path) as data:
+            return cls(data["w1"], data["b1"], data["w2"], data["b2"])
+
+    def save(self, path=MODEL_FILE):
+        np.savez(path, w1=self.w1, b1=self.b1, w2=self.w2, b2=self.b2)
+
+    def predict_features(self, x):
+        return (np.maximum(x @ self.w1 + self.b1, 0) @ self.w2 + self.b2)[:, 0]
+
+    # Predicted final score difference (AI minus player) for a batch of boards
+    def evaluate(self, boards):
+        count_evaluations(len(boards))
+        return self.predict_features(window_features(boards))
+
+    # Mean squared error regression with Adam
+    def train(self, x, y, epochs=20, batch_size=256, lr=1e-3, seed=0):
+        rng = np.random.default_rng(seed)
+        params = [self.w1, self.b1, self.w2, self.b2]
+        m = [np.zeros_like(p) for p in params]
+        v = [np.zeros_like(p) for p in params]
+        step = 0
+        for epoch in range(epochs):
+            order = rng.permutation(len(x))
+            for start in range(0, len(x), batch_size):
+                batch = order[start:start + batch_size]
+                xb, yb = x[batch], y[batch]
+                hidden = np.maximum(xb @ self.w1 + self.b1, 0)
+                error = (hidden @ self.w2 + self.b2)[:, 0] - yb
+                d_out = (2 / len(batch)) * error[:, None]
+                d_hidden = (d_out @ self.w2.T) * (hidden > 0)
+                grads = [xb.T @ d_hidden, d_hidden.sum(axis=0), hidden.T @ d_out, d_out.sum(axis=0)]
+                step += 1
+                for p, g, m_i, v_i in zip(params, grads, m, v):
+                    m_i[:] = 0.9 * m_i + 0.1 * g
+                    v_i[:] = 0.999 * v_i + 0.001 * g * g
+                    p -= lr * (m_i / (1 - 0.9 ** step)) / (np.sqrt(v_i / (1 - 0.999 ** step)) + 1e-8)
+            loss = np.mean((self.predict_features(x) - y) ** 2)
+            print(f"Epoch {epoch + 1}: mse {loss:.3f}")
+
+
+# Alpha-beta search whose last ply is evaluated in batches: at depth 1 every
+# child is scored by one call to `evaluate_batch` (boards -> AI-view values).
+# Searches for the AI by default; `piece=1` searches for the player instead.
+class BatchedSearch:
+    def __init__(self, evaluate_batch, piece=-1):
+        self.evaluate_batch = evaluate_batch
+        self.piece = piece
+        self.leaves = 0
+        self.batches = 0
+
+    def evaluate(self, boards):
+        return -self.piece * self.evaluate_batch(boards)  # Values from the searching side's view
+
+    def children(self, state, piece):
+        moves, states = [], []
+        for col in range(COLS):
+            if is_valid_move(state, col):
+                child_state = state.copy()
+                drop_piece(child_state, get_next_open_row(state, col), col, piece)
+                moves.append(col)
+                states.append(child_state)
+        return moves, states
+
+    def frontier(self, state, piece, pick):
+        moves, states = self.children(state, piece)
+        values = self.evaluate(np.array(states))
+        self.leaves += len(states)
+        self.batches += 1
+        best = int(pick(values))
+        return moves[best], values[best]
+
+    def leaf(self, state):
+        self.leaves += 1
+        self.batches += 1
+        return None, self.evaluate(state[None])[0]
+
+    def maximize(self, state, depth, alpha, beta):
+        visit_node()
+        if depth == 0 or is_full(state):  # Terminal condition
+            return self.leaf(state)
+        if depth == 1:
+            return self.frontier(state, self.piece, np.argmax)  # Our move
+
+        max_child, max_utility = None, -float('inf')
+        for col, child_state in zip(*self.children(state, self.piece)):
+            _, utility = self.minimize(child_state, depth - 1, alpha, beta)
+            if utility > max_utility:
+                max_child, max_utility = col, utility
+            alpha = max(alpha, max_utility)
+            if beta <= alpha:
+                break  # Prune the remaining branches
+        return max_child, max_utility
+
+    def minimize(self, state, depth, alpha, beta):
+        visit_node()
+        if depth == 0 or is_full(state):  # Terminal condition
+            return self.leaf(state)
+        if depth == 1:
+            return self.frontier(state, -self.piece, np.argmin)  # Opponent's move
+
+        min_child, min_utility = None, float('inf')
+        for col, child_state in zip(*self.children(state, -self.piece)):
+            _, utility = self.maximize(child_state, depth - 1, alpha, beta)
+            if utility < min_utility:
+                min_child, min_utility = col, utility
+            beta = min(beta, min_utility)
+            if beta <= alpha:
+                break  # Prune the remaining branches
+        return min_child, min_utility
+
+    def best_move(self, board, depth):
+        col, _ = self.maximize(board, depth, -float('inf'), float('inf'))
+        return col
+
+
+# Evaluation backends for BatchedSearch, by name
+def backend(name, model=None):
+    if name == "heuristic":
+        return lambda boards: np.array([evaluate_board(b) for b in boards])
+    if name == "heuristic-batched":
+        return evaluate_boards
+    if name == "valuenet":
+        return (model or load_model()).evaluate
+    raise ValueError(f"unknown evaluation backend {name!r}")
+
+
+_model = None
+
+def load_model():
+    global _model
+    if _model is None:
+        if not os.path.exists(MODEL_FILE):
+            raise FileNotFoundError(f"{MODEL_FILE} not found; train it with: python value_net.py train")
+        _model = ValueNet.load(MODEL_FILE)
+    return _model
+
+
+def ai_move_value_net(board, depth):
+    return BatchedSearch(load_model().evaluate).best_move(board, depth)
+
+
+def random_opening(board, rng, moves=4):
+    piece = 1
+    for _ in range(moves):
+        col = rng.choice([c for c in range(COLS) if is_valid_move(board, c)])
+        drop_piece(board, get_next_open_row(board, col), col, piece)
+        piece = -piece
+    return piece
+
+
+# Training data from self-play with the batched heuristic engine, with some
+# random moves mixed in for variety. Every position is labelled with the final
+# score difference (AI minus player) of its game.
+def self_play_positions(games, depth=2, randomness=0.1, seed=0):
+    from tune_weights import batched_move
+    rng = random.Random(seed)
+    weights = weight_vector()
+    boards, labels = [], []
+    for _ in range(games):
+        board = create_board()
+        piece = random_opening(board, rng)
+        positions = []
+        while not is_full(board):
+            if rng.random() < randomness:
+                col = rng.choice([c for c in range(COLS) if is_valid_move(board, c)])
+            else:
+                col = batched_move(board, piece, weights, depth)
+            drop_piece(board, get_next_open_row(board, col), col, piece)
+            positions.append(board.copy())
+            piece = -piece
+        player_score, ai_score = calculate_final_scores(board, verbose=False)
+        boards.extend(positions)
+        labels.extend([ai_score - player_score] * len(positions))
+    return np.array(boards), np.array(labels, dtype=float)
+
+
+def record_positions(path):
+    from game_record import training_positions
+    boards, labels = [], []
+    for board, label in training_positions(path):
+        boards.append(board)
+        labels.append(label)
+    return np.array(boards), np.array(labels, dtype=float)
+
+
+def train(games=2000, records=None, epochs=20, hidden=HIDDEN_UNITS, output=MODEL_FILE, seed=0):
+    if records:
+        boards, labels = record_positions(records)
+    else:
+        boards, labels = self_play_positions(games, seed=seed)
+    print(f"Training on {len(boards)} positions")
+    model = ValueNet.random(hidden, seed)
+    model.train(window_features(boards), labels, epochs, seed=seed)
+    model.save(output)
+    print(f"Model written to {output}")
+    return model
+
+
+# Leaves per second of each backend inside the same search
+def throughput(backends, positions, depth):
+    results = {}
+    for name, evaluate_batch in backends.items():
+        search = BatchedSearch(evaluate_batch)
+        start = time.perf_counter()
+        for board in positions:
+            search.best_move(board, depth)
+        elapsed = time.perf_counter() - start
+        results[name] = (search.leaves / elapsed, search.leaves / max(search.batches, 1), elapsed)
+    return results
+
+
+# Games between two backends at equal depth, each side moving first in half of
+# them. Returns the first backend's (wins, losses, draws).
+def strength(first, second, games, depth, seed=0):
+    rng = random.Random(seed)
+    wins = losses = draws = 0
+    for game in range(games):
+        board = create_board()
+        piece = random_opening(board, rng)
+        first_is_player = game % 2 == 0
+        while not is_full(board):
+            evaluate_batch = first if (piece == 1) == first_is_player else second
+            col = BatchedSearch(evaluate_batch, piece).best_move(board, depth)
+            drop_piece(board, get_next_open_row(board, col), col, piece)
+            piece = -piece
+        player_score, ai_score = calculate_final_scores(board, verbose=False)
+        mine, theirs = (player_score, ai_score) if first_is_player else (ai_score, player_score)
+        if mine > theirs:
+            wins += 1
+        elif mine < theirs:
+            losses += 1
+        else:
+            draws += 1
+    return wins, losses, draws
+
+
+def report(depth=3, games=20, positions=20, seed=0):
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(positions):
+        board = create_board()
+        random_opening(board, rng, rng.randint(2, 20))
+        boards.append(board)
+    backends = {name: backend(name) for name in ("heuristic", "heuristic-batched", "valuenet")}
+
+    print(f"Throughput at depth {depth} over {positions} positions:")
+    for name, (rate, per_batch, elapsed) in throughput(backends, boards, depth).items():
+        print(f"  {name:18} {rate:10.0f} leaves/s  ({per_batch:.1f} leaves per batch, {elapsed:.2f}s)")
+
+    wins, losses, draws = strength(backends["valuenet"], backends["heuristic-batched"], games, depth, seed)
+    print(f"Strength at depth {depth}: valuenet vs evaluate_board over {games} games: "
+          f"{wins} wins, {losses} losses, {draws} draws")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and compare the learned value function")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train", help="train the value net")
+    train_parser.add_argument("--games", type=int, default=2000, help="self-play games to learn from")
+    train_parser.add_argument("--records", default=None, help="learn from a game record file instead")
+    train_parser.add_argument("--epochs", type=int, default=20)
+    train_parser.add_argument("--hidden", type=int, default=HIDDEN_UNITS)
+    train_parser.add_argument("--output", default=MODEL_FILE)
+    report_parser = commands.add_parser("report", help="throughput and strength against evaluate_board")
+    report_parser.add_argument("--depth", type=int, default=3)
+    report_parser.add_argument("--games", type=int, default=20)
+    report_parser.add_argument("--positions", type=int, default=20)
+    args = parser.parse_args()
+    if args.command == "train":
+        train(args.games, args.records, args.epochs, args.hidden, args.output)
+    else:
+        report(args.depth, args.games, args.positions)